@@ -1,61 +1,136 @@
-from pyassimp import load, postprocess
+import logging
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+try:
+    from pyassimp import load, postprocess
+except (KeyboardInterrupt, SystemExit):
+    raise
+except BaseException as e:
+    # pyassimp raises an AssimpError, not an Exception, when it finds no
+    # assimp library
+    raise ImportError('pyassimp not usable: %s' % e)
+
+from meshtools import MeshOperations
+from objloader import MATERIAL_VERTEX_FORMAT, VERTEX_FORMAT
+from stats import Stats
+
+logger = logging.getLogger(__name__)
 
 
 class AssimpObjLoader(object):
-    def __init__(self, source):
+    def __init__(self, source, per_vertex_material=False,
+                 generate_normals=True, crease_angle=None,
+                 normal_weighting='area', lod_ratios=(),
+                 optimize_indices=False, quantize=(), progress=None,
+                 stats=None, workers=None):
+        """Loads a file through assimp, with the options of
+        :class:`objloader.ObjFileLoader` that apply to it: with
+        ``generate_normals``, meshes without normals get smooth ones."""
+        # meshes are converted by ``workers`` threads, all the cores by
+        # default, numpy releasing the gil in most of the work; assimp's
+        # structures can't be sent to other processes
         # super(AssimpObjLoader, **kwargs)
         # source = kwargs.get('source', '')
+        # assimp reads the materials while parsing, there's no 'material'
+        # stage
+        self.stats = stats = stats if stats is not None else Stats()
         if not source:
-            print "no source given!"
+            logger.warning("AssimpObjLoader: no source given!")
             return
 
-        self.scene = scene = load(
-            source, 0
-            | postprocess.aiProcess_Triangulate
-            | postprocess.aiProcess_SplitLargeMeshes
-            | postprocess.aiProcess_GenNormals
-            )
+        loading = None
+        with stats.stage('parse'):
+            scene = load(
+                source, processing=0
+                | postprocess.aiProcess_Triangulate
+                | postprocess.aiProcess_SplitLargeMeshes
+                )
+            if hasattr(scene, '__enter__'):
+                # pyassimp 4 and later load in a context manager, which
+                # releases the scene once the meshes are converted
+                loading, scene = scene, scene.__enter__()
+        self.scene = scene
+
+        def convert(mesh):
+            with stats.stage('buffers'):
+                converted = AssimpMesh(scene, mesh, per_vertex_material)
+                if generate_normals and not len(mesh.normals):
+                    converted.calculate_normals(
+                        crease_angle, normal_weighting)
+                if lod_ratios:
+                    converted.build_lods(lod_ratios)
+                if optimize_indices:
+                    measured = converted.optimize_indices(
+                        measure=logger.isEnabledFor(logging.DEBUG))
+                    if measured:
+                        logger.debug(
+                            "AssimpObjLoader: optimized %s indices, acmr "
+                            "%.3f -> %.3f", mesh, *measured)
+                if quantize:
+                    report = converted.quantize(quantize)
+                    logger.debug(
+                        "AssimpObjLoader: quantized %s, %d -> %d bytes, "
+                        "errors %s", mesh, report['bytes'],
+                        report['packed_bytes'], report['errors'])
+            return converted
 
         self.objects = {}
-        for i, mesh in enumerate(scene.meshes):
-            self.objects[i] = AssimpMesh(scene, mesh)
-
-
-class AssimpMesh(object):
-    def __init__(self, scene, mesh):
-        self.vertex_format = [
-            ('v_pos', 3, 'float'),
-            ('v_normal', 3, 'float'),
-            ('v_tc0', 2, 'float'),
-            ('v_ambient', 3, 'float'),
-            ('v_diffuse', 3, 'float'),
-            ('v_specular', 3, 'float'),
-            ('v_specular_coeff', 1, 'float'),
-            ('v_transparency', 1, 'float'),
-            ]
-
-        self.vertices = []
-        self.indices = []
-        self.texture = mesh.material.properties.get(('file', 1L))
-
-        ambiant = [0.0, 0.0, 0.0]
-        diffuse = [1.0, 1.0, 1.0]
-        specular = [1.0, 1.0, 1.0]
-
-        for i, v in enumerate(mesh.vertices):
-            data = (
-                list(v) + list(mesh.normals[i]) +
-                list(mesh.texturecoords[0][i][:2]
-                     if len(mesh.texturecoords) else [0, 0]) +
-                mesh.material.properties.get(('ambiant', 0L), ambiant) +
-                mesh.material.properties.get(('diffuse', 0L), diffuse) +
-                mesh.material.properties.get(('specular', 0L), specular) + [
-                    mesh.material.properties.get(('refracti', 0L), 1),
-                    mesh.material.properties.get(('opacity', 0L), 1)
-                ]
-            )
-
-            self.vertices.extend(data)
-
-        for f in mesh.faces:
-            self.indices.extend(f)
+        pool = ThreadPool(workers or cpu_count())
+        try:
+            for i, converted in enumerate(pool.imap(convert, scene.meshes)):
+                self.objects[i] = converted
+                if progress:
+                    progress((i + 1) / float(len(scene.meshes)))
+        finally:
+            pool.terminate()
+            if loading is not None:
+                loading.__exit__(None, None, None)
+                self.scene = None
+
+
+class AssimpMesh(MeshOperations):
+    def __init__(self, scene, mesh, per_vertex_material=False):
+        if per_vertex_material:
+            self.vertex_format = list(MATERIAL_VERTEX_FORMAT)
+        else:
+            self.vertex_format = list(VERTEX_FORMAT)
+
+        self.lods = []
+        self.quantization = None
+        self.texture = mesh.material.properties.get(('file', 1))
+
+        properties = mesh.material.properties
+        self.ambient_color = properties.get(('ambient', 0), [0.0, 0.0, 0.0])
+        self.diffuse_color = properties.get(('diffuse', 0), [1.0, 1.0, 1.0])
+        self.specular_color = properties.get(
+            ('specular', 0), [1.0, 1.0, 1.0])
+        self.specular_coefficent = properties.get(('shininess', 0), 1)
+        self.transparency = properties.get(('opacity', 0), 1)
+
+        positions = np.asarray(mesh.vertices, dtype='float32').reshape(-1, 3)
+        stride = sum(x[1] for x in self.vertex_format)
+        vertices = np.zeros((len(positions), stride), dtype='float32')
+        vertices[:, 0:3] = positions
+        if len(mesh.normals):
+            vertices[:, 3:6] = np.asarray(mesh.normals).reshape(-1, 3)
+        if len(mesh.texturecoords):
+            vertices[:, 6:8] = np.asarray(
+                mesh.texturecoords[0]).reshape(len(positions), -1)[:, :2]
+        if per_vertex_material:
+            vertices[:, 8:19] = (
+                list(self.ambient_color)[:3] +
+                list(self.diffuse_color)[:3] +
+                list(self.specular_color)[:3] +
+                [self.specular_coefficent, self.transparency])
+        self.vertices = vertices.reshape(-1)
+
+        try:
+            self.indices = np.asarray(mesh.faces, dtype='uint32').reshape(-1)
+        except ValueError:
+            # points and lines left by the triangulation
+            self.indices = np.concatenate([
+                np.asarray(face, dtype='uint32').reshape(-1)
+                for face in mesh.faces])
+        self.compute_bounds()
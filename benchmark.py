@@ -0,0 +1,286 @@
+'''Benchmarks of the loaders and of the buffers built for drawing.
+
+Scenes are generated deterministically, so runs on different versions
+compare the same work. Nothing here needs a window or a GL context, the
+arguments of the Mesh instructions are prepared as the renderer does,
+without creating them.
+
+    python benchmark.py --objects 8 --triangles 100000 --output new.json
+    python benchmark.py --compare old.json
+
+Each benchmark reports its best time over ``--repeat`` runs and, where
+tracemalloc is available, the peak memory allocated during one more run.
+With ``--compare``, benchmarks slower than the previous results by more
+than ``--tolerance`` are reported and the exit status is 1.
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from os.path import join
+
+import numpy as np
+
+import meshtools
+from lazyobj import LazyObjFileLoader, scan_objects
+from meshcache import MeshCache
+from objloader import MTL, ObjFileLoader
+from quantization import quantization_report, quantize
+from stats import timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def generate_scene(directory, objects=4, triangles=10000, normals=True,
+                   texcoords=True, materials=4, seed=0):
+    """Write a scene of ``objects`` noisy grids of about ``triangles``
+    triangles each, with ``materials`` materials, to scene.obj and
+    scene.mtl in ``directory``, and return the path of the .obj.
+
+    The same arguments always give the same files.
+    """
+    random = np.random.RandomState(seed)
+    side = max(int(np.sqrt(triangles / 2.)), 1) + 1
+    path = join(directory, 'scene.obj')
+
+    with open(join(directory, 'scene.mtl'), 'w') as f:
+        for i in range(materials):
+            ka, kd, ks = random.uniform(0, 1, (3, 3))
+            f.write(
+                'newmtl material%d\n'
+                'Ka %f %f %f\nKd %f %f %f\nKs %f %f %f\n'
+                'Ns %f\nd %f\n\n' % (
+                    (i, ) + tuple(ka) + tuple(kd) + tuple(ks) +
+                    (random.uniform(1, 100), random.uniform(.5, 1))))
+
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    quads = (
+        np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side
+    ).ravel() + 1
+    faces = np.concatenate([
+        np.stack([quads, quads + 1, quads + side], axis=1),
+        np.stack([quads + 1, quads + side + 1, quads + side], axis=1)])
+
+    if normals and texcoords:
+        corner = '%d/%d/%d'
+    elif normals:
+        corner = '%d//%d'
+    elif texcoords:
+        corner = '%d/%d'
+    else:
+        corner = '%d'
+    repeat = 1 + normals + texcoords
+
+    with open(path, 'w') as f:
+        if materials:
+            f.write('mtllib scene.mtl\n')
+        offset = 0
+        for i in range(objects):
+            f.write('o object%d\n' % i)
+            if materials:
+                f.write('usemtl material%d\n' % (i % materials))
+            positions = np.stack([
+                x.ravel() + i * side, y.ravel(),
+                random.uniform(0, 1, side * side)], axis=1)
+            np.savetxt(f, positions, fmt='v %.6f %.6f %.6f')
+            if texcoords:
+                np.savetxt(
+                    f, np.stack([x.ravel(), y.ravel()], axis=1) / (side - 1.),
+                    fmt='vt %.6f %.6f')
+            if normals:
+                vectors = random.normal(0, .1, (side * side, 3)) + [0, 0, 1]
+                vectors /= np.sqrt((vectors ** 2).sum(axis=1))[:, None]
+                np.savetxt(f, vectors, fmt='vn %.6f %.6f %.6f')
+            np.savetxt(
+                f, np.repeat(faces + offset, repeat, axis=1),
+                fmt='f ' + ' '.join([corner] * 3))
+            offset += side * side
+    return path
+
+
+def measure(function, repeat=3):
+    """Return the best time of ``repeat`` calls to ``function``, the peak
+    memory it allocates, or None without tracemalloc, and the result of
+    the fastest call."""
+    best = None
+    for i in range(repeat):
+        start = timer()
+        value = function()
+        duration = timer() - start
+        if best is None or duration < best:
+            best, result = duration, value
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def run(directory, objects=4, triangles=10000, normals=True, texcoords=True,
+        materials=4, repeat=3, seed=0):
+    """Run the benchmarks on a scene generated in ``directory``, return
+    their results, by name, as dicts of time, peak_memory and details."""
+    results = {}
+
+    def add(name, function, **details):
+        duration, peak, result = measure(function, repeat)
+        results[name] = dict(time=duration, peak_memory=peak, **details)
+        print('%-20s %8.3fs %10s' % (
+            name, duration,
+            '%.1fMB' % (peak / 1048576.) if peak is not None else '-'))
+        return result
+
+    start = timer()
+    path = generate_scene(
+        directory, objects, triangles, normals, texcoords, materials, seed)
+    print('generated %s (%.1fMB) in %.2fs' % (
+        path, os.path.getsize(path) / 1048576., timer() - start))
+
+    if materials:
+        add('mtl', lambda: MTL(join(directory, 'scene.mtl')))
+
+    scene = add(
+        'obj_loader', lambda: ObjFileLoader(path),
+        file_size=os.path.getsize(path))
+    meshes = list(scene.objects.values())
+    results['obj_loader'].update(
+        objects=len(meshes),
+        vertices=sum(
+            len(m.vertices) // sum(x[1] for x in m.vertex_format)
+            for m in meshes),
+        triangles=sum(len(m.indices) // 3 for m in meshes))
+
+    # stages of the last load, finish_object being the 'buffers' one
+    results['obj_loader']['stages'] = dict(scene.stats.timings)
+    spent = scene.stats.timings.get('buffers', 0)
+    results['finish_object'] = dict(time=spent, peak_memory=None)
+    print('%-20s %8.3fs %10s' % ('finish_object', spent, '-'))
+
+    add('compute_bounds', lambda: [m.compute_bounds() for m in meshes])
+    add('corner_normals', lambda: [
+        meshtools.recalculate_normals(m.vertices, m.indices, m.vertex_format)
+        for m in meshes])
+    add('build_lods', lambda: [
+        meshtools.build_lods(m.vertices, m.indices, m.vertex_format)
+        for m in meshes])
+    add('mesh_arguments', lambda: [
+        meshtools.mesh_arguments(m.vertices, m.indices, m.vertex_format)
+        for m in meshes])
+    optimized = add('optimize_indices', lambda: [
+        meshtools.optimize_indices(m.vertices, m.indices, m.vertex_format)
+        for m in meshes])
+    results['optimize_indices'].update(
+        acmr_before=float(np.mean(
+            [meshtools.acmr(m.indices) for m in meshes] or [0])),
+        acmr_after=float(np.mean(
+            [meshtools.acmr(indices) for vertices, indices in optimized] or
+            [0])))
+    packed = add('quantize', lambda: [
+        quantize(m.vertices, m.vertex_format) for m in meshes])
+    reports = [
+        quantization_report(m.vertices, m.vertex_format, *p)
+        for m, p in zip(meshes, packed)]
+    results['quantize'].update(
+        bytes=sum(r['bytes'] for r in reports),
+        packed_bytes=sum(r['packed_bytes'] for r in reports),
+        errors=dict(
+            (name, max(r['errors'][name] for r in reports))
+            for name in reports[0]['errors']) if reports else {})
+
+    index = add('scan_objects', lambda: scan_objects(path))
+    last = index['objects'][-1][0] if index['objects'] else None
+    add('lazy_object', lambda: LazyObjFileLoader(
+        path, index=index).objects.get(last), object=last)
+
+    cache = MeshCache(join(directory, 'cache'))
+    key = cache.key(path, ObjFileLoader)
+    add('mesh_cache_store', lambda: cache.store(key + 'bench', path, scene))
+    cache.store(key, path, scene)
+    add('mesh_cache_read', lambda: cache.read(key))
+
+    try:
+        from assimpobjloader import AssimpObjLoader
+    except Exception as e:
+        print('assimp loader skipped: %s' % e)
+    else:
+        add('assimp_loader', lambda: AssimpObjLoader(path))
+    return results
+
+
+def compare(results, previous, tolerance):
+    """Print how ``results`` compare with ``previous`` ones, return the
+    names of the benchmarks slower by more than ``tolerance``."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in previous:
+            continue
+        ratio = result['time'] / max(previous[name]['time'], 1e-9)
+        slower = ratio > tolerance
+        if slower:
+            regressions.append(name)
+        print('%-20s %6.2fx %s' % (name, ratio, 'SLOWER' if slower else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--objects', type=int, default=4)
+    parser.add_argument('--triangles', type=int, default=100000,
+                        help='triangles per object')
+    parser.add_argument('--no-normals', action='store_true')
+    parser.add_argument('--no-texcoords', action='store_true')
+    parser.add_argument('--materials', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='json file to write results to')
+    parser.add_argument('--compare', help='json file of previous results')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='ddd-benchmark')
+    try:
+        results = run(
+            directory, args.objects, args.triangles, not args.no_normals,
+            not args.no_texcoords, args.materials, args.repeat, args.seed)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'parameters': {
+            'objects': args.objects, 'triangles': args.triangles,
+            'normals': not args.no_normals,
+            'texcoords': not args.no_texcoords,
+            'materials': args.materials, 'repeat': args.repeat,
+            'seed': args.seed},
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform()},
+        'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous.get('parameters') != report['parameters']:
+            print('warning: previous results used other parameters')
+        if compare(results, previous['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
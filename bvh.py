@@ -0,0 +1,119 @@
+'''Bounding volume hierarchies of the triangles of meshes, to find the
+first triangle a ray hits.
+
+Triangles are sorted along a Z-order curve and grouped in leaves of
+LEAF_SIZE, whose boxes are merged BRANCHING by BRANCHING up to the root,
+so a tree is built with a few array operations. Rays go down the tree a
+level at a time, testing all the nodes they may cross at once, a wide
+tree keeping the number of levels low.
+'''
+import numpy as np
+
+from meshtools import morton_order
+
+LEAF_SIZE = 8
+BRANCHING = 8
+
+
+def ray_boxes(origin, direction, boxes):
+    """Return the distances, in lengths of ``direction``, at which the ray
+    enters and leaves each of the (N, 2, 3) low and high corners of
+    ``boxes``; it misses those it leaves before entering."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1. / np.asarray(direction, dtype='float64')
+        t1 = (boxes[:, 0] - origin) * inverse
+        t2 = (boxes[:, 1] - origin) * inverse
+    # fmin and fmax ignore the nans of rays parallel to a face
+    return np.fmin(t1, t2).max(axis=1), np.fmax(t1, t2).min(axis=1)
+
+
+def ray_triangles(origin, direction, corners):
+    """Return the distance, in lengths of ``direction``, at which the ray
+    hits each of the (N, 3, 3) ``corners`` of triangles, inf for those it
+    misses."""
+    corners = np.asarray(corners, dtype='float64')
+    a = corners[:, 0]
+    e1 = corners[:, 1] - a
+    e2 = corners[:, 2] - a
+    p = np.cross(direction, e2)
+    det = (e1 * p).sum(axis=1)
+    s = origin - a
+    q = np.cross(s, e1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1. / det
+        u = (s * p).sum(axis=1) * inverse
+        v = q.dot(direction) * inverse
+        t = (e2 * q).sum(axis=1) * inverse
+    hit = (
+        (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) &
+        (t >= 0))
+    return np.where(hit, t, np.inf)
+
+
+class BVH(object):
+    """Hierarchy of the boxes of the (N, 3) ``triangles`` of ``positions``.
+
+    :attr:`levels` holds the boxes of the nodes of each level from the
+    root, the children of node i being nodes ``branching * i`` to
+    ``branching * (i + 1) - 1`` of the next level, and the last level the
+    boxes of the leaves.
+    """
+    def __init__(self, positions, triangles, leaf_size=LEAF_SIZE,
+                 branching=BRANCHING):
+        positions = np.asarray(positions, dtype='float32').reshape(-1, 3)
+        triangles = np.asarray(triangles, dtype='int64').reshape(-1, 3)
+        self.leaf_size = leaf_size
+        self.branching = branching
+        corners = positions[triangles]
+        # triangle numbers in the order of the leaves
+        self.order = morton_order(corners.mean(axis=1))
+        self.corners = corners[self.order]
+        self.levels = []
+        if not len(triangles):
+            return
+
+        starts = np.arange(0, len(triangles), leaf_size)
+        boxes = np.stack([
+            np.minimum.reduceat(self.corners.min(axis=1), starts),
+            np.maximum.reduceat(self.corners.max(axis=1), starts)], axis=1)
+        self.levels.append(boxes)
+        while len(boxes) > 1:
+            # the last node may have less children
+            missing = -len(boxes) % branching
+            groups = np.concatenate(
+                [boxes, boxes[-1:].repeat(missing, axis=0)]
+            ).reshape(-1, branching, 2, 3)
+            boxes = np.stack([
+                groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1)],
+                axis=1)
+            self.levels.append(boxes)
+        self.levels.reverse()
+
+    def intersect(self, origin, direction):
+        """Return the (triangle, distance) of the first triangle hit by the
+        ray from ``origin`` along ``direction``, the distance in lengths
+        of ``direction``, or None."""
+        origin = np.asarray(origin, dtype='float64')
+        direction = np.asarray(direction, dtype='float64')
+        nodes = np.zeros(1, dtype='int64')
+        for depth, boxes in enumerate(self.levels):
+            if depth:
+                nodes = (
+                    nodes[:, None] * self.branching +
+                    np.arange(self.branching)).ravel()
+                nodes = nodes[nodes < len(boxes)]
+            near, far = ray_boxes(origin, direction, boxes[nodes])
+            nodes = nodes[(near <= far) & (far >= 0)]
+            if not len(nodes):
+                return None
+
+        candidates = (
+            nodes[:, None] * self.leaf_size + np.arange(self.leaf_size)
+        ).ravel()
+        candidates = candidates[candidates < len(self.order)]
+        distances = ray_triangles(
+            origin, direction, self.corners[candidates])
+        best = distances.argmin()
+        if distances[best] == np.inf:
+            return None
+        return int(self.order[candidates[best]]), float(distances[best])
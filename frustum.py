@@ -0,0 +1,98 @@
+'''View frustum culling of meshes, from their bounding volumes.
+
+Matrices are 4x4 numpy arrays transforming column vectors, composed in the
+order of the canvas instructions they mirror, like OpenGL does.
+'''
+import numpy as np
+
+
+def translation(xyz):
+    """Matrix of a Translate instruction."""
+    m = np.identity(4)
+    m[:3, 3] = xyz
+    return m
+
+
+def rotation(angle, x, y, z):
+    """Matrix of a Rotate instruction, ``angle`` is in degrees."""
+    axis = np.array([x, y, z], dtype='float64')
+    axis /= np.sqrt((axis ** 2).sum()) or 1
+    x, y, z = axis
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    t = 1 - c
+    m = np.identity(4)
+    m[:3, :3] = [
+        [c + x * x * t, x * y * t - z * s, x * z * t + y * s],
+        [y * x * t + z * s, c + y * y * t, y * z * t - x * s],
+        [z * x * t - y * s, z * y * t + x * s, c + z * z * t]]
+    return m
+
+
+def scaling(factor):
+    """Matrix of a Scale instruction with the same factor on all axes."""
+    m = np.identity(4)
+    m[:3, :3] *= factor
+    return m
+
+
+def from_kivy(matrix):
+    """Return a kivy Matrix as a numpy array."""
+    # kivy matrices are stored column by column
+    return np.array(matrix.get(), dtype='float64').reshape(4, 4).T
+
+
+def frustum_planes(matrix):
+    """Return the (6, 4) planes bounding the space ``matrix`` projects into
+    the clip volume, their normals pointing inside."""
+    planes = np.array([
+        matrix[3] + matrix[0], matrix[3] - matrix[0],
+        matrix[3] + matrix[1], matrix[3] - matrix[1],
+        matrix[3] + matrix[2], matrix[3] - matrix[2]])
+    lengths = np.sqrt((planes[:, :3] ** 2).sum(axis=1))
+    return planes / np.where(lengths > 0, lengths, 1)[:, None]
+
+
+def visible(planes, boxes, spheres):
+    """Return whether each volume intersects the frustum of ``planes``.
+
+    ``boxes`` are the (N, 2, 3) low and high corners of axis aligned boxes,
+    ``spheres`` the (N, 4) center and radius of spheres around the same
+    meshes; the sphere test rejects most meshes, the box one is tighter.
+    """
+    normals, offsets = planes[:, :3], planes[:, 3]
+    spheres = np.asarray(spheres, dtype='float64').reshape(-1, 4)
+    distances = spheres[:, :3].dot(normals.T) + offsets
+    inside = (distances >= -spheres[:, 3:]).all(axis=1)
+
+    # corner of each box the farthest along the normal of each plane
+    boxes = np.asarray(boxes, dtype='float64').reshape(-1, 2, 3)
+    corners = np.where(
+        normals[None] >= 0, boxes[:, 1:2], boxes[:, 0:1])
+    distances = (corners * normals[None]).sum(axis=-1) + offsets
+    return inside & (distances >= 0).all(axis=1)
+
+
+def transform_boxes(matrices, boxes):
+    """Return the (N, 2, 3) axis aligned boxes around the (N, 2, 3)
+    ``boxes`` transformed by the (N, 4, 4) ``matrices``."""
+    matrices = np.asarray(matrices, dtype='float64')
+    boxes = np.asarray(boxes, dtype='float64').reshape(-1, 2, 3)
+    center = (boxes[:, 0] + boxes[:, 1]) / 2.
+    extent = (boxes[:, 1] - boxes[:, 0]) / 2.
+    linear = matrices[:, :3, :3]
+    center = np.einsum('nij,nj->ni', linear, center) + matrices[:, :3, 3]
+    extent = np.einsum('nij,nj->ni', np.abs(linear), extent)
+    return np.stack([center - extent, center + extent], axis=1)
+
+
+def transform_spheres(matrices, spheres):
+    """Return the (N, 4) center and radius of spheres around the (N, 4)
+    ``spheres`` transformed by the (N, 4, 4) ``matrices``."""
+    matrices = np.asarray(matrices, dtype='float64')
+    spheres = np.asarray(spheres, dtype='float64').reshape(-1, 4)
+    centers = np.einsum(
+        'nij,nj->ni', matrices[:, :3, :3], spheres[:, :3]) + \
+        matrices[:, :3, 3]
+    # the largest scale of each matrix
+    scales = np.sqrt((matrices[:, :3, :3] ** 2).sum(axis=1).max(axis=1))
+    return np.concatenate([centers, (spheres[:, 3] * scales)[:, None]], 1)
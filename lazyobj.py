@@ -0,0 +1,293 @@
+'''Loading the objects of Wavefront OBJ files one at a time, on demand.
+
+The file is scanned once for the byte ranges of its objects, the ``o``
+(or ``# object``) blocks, along with the number of attribute records
+before each and the material and smoothing group in effect there, without
+parsing any record. The index is saved next to the file, or in a
+:class:`meshcache.MeshCache`, so later loads don't even scan it.
+
+Only the block of an object is parsed when it's looked up, plus the
+blocks holding the records its faces refer to outside of it, such as the
+vertices shared at the top of the file; those are kept for the next
+objects. Switching between the parts of a catalogue file then costs the
+parsing of one part instead of the whole file.
+'''
+import io
+import json
+import logging
+from os.path import dirname, getmtime, getsize, join
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy as np
+
+from objloader import (
+    MTL, NORMAL, OTHER, TEXCOORD, VERTEX, ObjFileLoader, _AttributePool,
+    _Chunk, _classify, _read_chunks)
+
+logger = logging.getLogger(__name__)
+
+# bump when the layout of the index changes
+INDEX_VERSION = 1
+
+
+def _object_name(line, delimiter):
+    """Return the name of the object statement ``line`` starts, or None,
+    as :meth:`objloader.ObjFileLoader.parse_statement` reads it."""
+    if delimiter == "# object" and "# object" in line:
+        return line.split()[2]
+    values = line.split()
+    if not line.startswith('#') and values[0] == 'o':
+        return values[1]
+    return None
+
+
+def scan_objects(filename, delimiter="# object"):
+    """Return the index of the objects of OBJ file ``filename``, a json
+    serializable dict:
+
+    - ``segments``: (start, end) byte ranges, the part before the first
+      object then the block of each object
+    - ``counts``: numbers of v, vt and vn records before each segment,
+      and in the whole file
+    - ``states``: usemtl, smoothing group and mtllib in effect at the
+      start of each segment
+    - ``objects``: (name, segment) of each object, in the file order
+
+    along with the size and modification time of the file it describes.
+    """
+    size = getsize(filename)
+    segments = [[0, size]]
+    counts = [[0, 0, 0]]
+    states = [[None, 1, None]]
+    objects = []
+    material, smoothing, mtllib = None, 1, None
+    done = np.zeros(3, dtype='int64')
+    offset = 0
+    with open(filename, 'rb') as f:
+        for block in _read_chunks(f):
+            starts, ends, firsts, kinds = _classify(block)
+            before = np.stack([
+                np.cumsum(kinds == kind) - (kinds == kind)
+                for kind in (VERTEX, TEXCOORD, NORMAL)], axis=-1)
+            for i in np.flatnonzero((kinds == OTHER) & (firsts < ends)):
+                line = block[firsts[i]:ends[i]].decode('utf-8', 'replace')
+                name = _object_name(line, delimiter)
+                if name is not None:
+                    segments[-1][1] = offset + int(starts[i])
+                    segments.append([offset + int(starts[i]), size])
+                    counts.append((done + before[i]).tolist())
+                    states.append([material, smoothing, mtllib])
+                    objects.append([name, len(segments) - 1])
+                    continue
+                values = line.split()
+                if line.startswith('#'):
+                    continue
+                elif line.startswith('s'):
+                    if values[0] == 's':
+                        try:
+                            smoothing = int(values[1])
+                        except (IndexError, ValueError):
+                            smoothing = 0
+                elif values[0] == 'mtllib':
+                    mtllib = values[1]
+                elif values[0] in ('usemtl', 'usemat'):
+                    material = values[1]
+            done += np.bincount(kinds, minlength=5)[
+                [VERTEX, TEXCOORD, NORMAL]]
+            offset += len(block)
+    counts.append(done.tolist())
+    return {
+        'version': INDEX_VERSION,
+        'delimiter': delimiter,
+        'size': size,
+        'mtime': getmtime(filename),
+        'segments': segments,
+        'counts': counts,
+        'states': states,
+        'objects': objects}
+
+
+def index_matches(index, filename, delimiter="# object"):
+    """Tell if ``index`` was built by :func:`scan_objects` from the current
+    version of ``filename``."""
+    return (
+        index is not None and
+        index.get('version') == INDEX_VERSION and
+        index.get('delimiter') == delimiter and
+        index.get('size') == getsize(filename) and
+        index.get('mtime') == getmtime(filename))
+
+
+def object_index(filename, delimiter="# object", path=None):
+    """Return the :func:`scan_objects` index of ``filename``, read from
+    ``path``, by default next to the file, unless the file changed since.
+    A new index is written there if possible."""
+    if path is None:
+        path = filename + '.index.json'
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        index = None
+    if index_matches(index, filename, delimiter):
+        return index
+
+    index = scan_objects(filename, delimiter)
+    try:
+        with open(path, 'w') as f:
+            json.dump(index, f)
+    except (IOError, OSError) as e:
+        logger.debug("LazyObjFileLoader: index not saved, %s", e)
+    return index
+
+
+class LazyObjects(Mapping):
+    """Objects of a :class:`LazyObjFileLoader` by name, each parsed the
+    first time it's looked up."""
+    def __init__(self, loader):
+        self.loader = loader
+        self._meshes = {}
+
+    def __getitem__(self, name):
+        mesh = self._meshes.get(name)
+        if mesh is None:
+            if name not in self.loader.segments:
+                raise KeyError(name)
+            mesh = self._meshes[name] = self.loader.load_object(name)
+        return mesh
+
+    def __contains__(self, name):
+        # without parsing it
+        return name in self.loader.segments
+
+    def __iter__(self):
+        return iter(self.loader.segments)
+
+    def __len__(self):
+        return len(self.loader.segments)
+
+    def loaded(self):
+        """Return the names of the objects parsed so far."""
+        return list(self._meshes)
+
+
+class LazyObjFileLoader(ObjFileLoader):
+    """:class:`objloader.ObjFileLoader` only scanning the file, its
+    :attr:`objects` being a :class:`LazyObjects` parsing each object when
+    first looked up.
+
+    ``index`` is the :func:`scan_objects` index of the file, if already
+    known, else it's kept in ``mesh_cache`` if given, a
+    :class:`meshcache.MeshCache`, or read from or written to
+    ``index_path``, see :func:`object_index`. Other options are the ones of
+    :class:`objloader.ObjFileLoader`, ``stream`` excepted.
+    """
+    def __init__(self, filename, index=None, index_path=None,
+                 mesh_cache=None, swapyz=False, delimiter="# object",
+                 progress=None, **options):
+        super(LazyObjFileLoader, self).__init__(
+            filename, swapyz=swapyz, delimiter=delimiter, stream=True,
+            **options)
+        self.swapyz = swapyz
+        if not index_matches(index, filename, delimiter):
+            with self.stats.stage('scan'):
+                if mesh_cache is not None:
+                    index = mesh_cache.load_index(
+                        filename, scan_objects, delimiter=delimiter)
+                else:
+                    index = object_index(filename, delimiter, index_path)
+        self.index = index
+        if progress:
+            progress(1.)
+        # segment of each object, the last one of a repeated name wins
+        # like in the objects dict of ObjFileLoader
+        self.segments = {}
+        for name, segment in index['objects']:
+            self.segments[name] = segment
+        # v, vt and vn records of the segments read for the objects
+        # referring to them
+        self._records = {}
+        self._materials = {}
+        self.objects = LazyObjects(self)
+        logger.debug(
+            "LazyObjFileLoader: %s, %d objects", filename, len(self.segments))
+
+    def read_segment(self, segment):
+        """Return the bytes of ``segment`` of the file."""
+        start, end = self.index['segments'][segment]
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def segment_records(self, segment):
+        """Return the (v, vt, vn) records of ``segment``, parsed once."""
+        records = self._records.get(segment)
+        if records is None:
+            chunks = [
+                _Chunk(block)
+                for block in _read_chunks(io.BytesIO(
+                    self.read_segment(segment)))]
+            records = self._records[segment] = tuple(
+                np.concatenate(
+                    [getattr(chunk, attr) for chunk in chunks] or
+                    [np.zeros((0, width), dtype='float32')])
+                for attr, width in (
+                    ('vertices', 3), ('texcoords', 2), ('normals', 3)))
+        return records
+
+    def load_object(self, name):
+        """Parse object ``name`` and return its MeshData."""
+        segment = self.segments[name]
+        before = self.index['counts'][segment]
+        after = self.index['counts'][segment + 1]
+        self.obj_material, self.smoothing_group, mtllib = (
+            self.index['states'][segment])
+        self.mtl = {}
+        if mtllib is not None:
+            if mtllib not in self._materials:
+                with self.stats.stage('material'):
+                    self._materials[mtllib] = MTL(
+                        join(dirname(self.filename), mtllib))
+            self.mtl = self._materials[mtllib]
+
+        # the records before the object are only filled where referred to
+        self.vertices, self.texcoords, self.normals = [
+            _AttributePool(width, swap, skipped, end + 1)
+            for width, swap, skipped, end in zip(
+                (3, 2, 3), (self.swapyz, False, self.swapyz),
+                before, after)]
+        self.faces = []
+        self._current_object = None
+        with self.stats.stage('parse'):
+            for block in _read_chunks(io.BytesIO(
+                    self.read_segment(segment))):
+                self.parse_chunk(_Chunk(block))
+            self.put_shared_records(segment)
+        self.finish_object()
+        finished, self._finished = self._finished, []
+        logger.debug("LazyObjFileLoader: loaded %s", name)
+        return finished[-1][1]
+
+    def put_shared_records(self, segment):
+        """Fill the records the faces of the current object refer to
+        before ``segment``, from the segments holding them."""
+        if not self.faces:
+            return
+        corners = np.concatenate([c for c, n, g in self.faces])
+        counts = np.array(self.index['counts'], dtype='int64')
+        shared = set()
+        for column, before in enumerate(counts[segment]):
+            refs = corners[:, column]
+            refs = refs[(refs > 0) & (refs <= before)]
+            # segments are the last ones starting before each record
+            shared.update(np.searchsorted(
+                counts[:, column], np.unique(refs) - 1, side='right') - 1)
+        pools = self.vertices, self.texcoords, self.normals
+        for other in sorted(shared):
+            for pool, start, records in zip(
+                    pools, counts[other], self.segment_records(other)):
+                pool.put(start, records)
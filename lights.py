@@ -0,0 +1,94 @@
+'''Lights of a scene, and the ones reaching each object.
+
+Lights are points with a range, beyond which they don't light anything,
+0 meaning everywhere. The shader only loops over the lights given to each
+draw, at most MAX_LIGHTS, the size of its light arrays: the ones reaching
+the bounding sphere of the object, nearest first.
+'''
+import numpy as np
+
+# size of the light arrays of simple.glsl
+MAX_LIGHTS = 16
+
+
+def enclosing_sphere(spheres):
+    """Return the (4, ) center and radius of a sphere around the (N, 4)
+    ``spheres``, centered on the box around them."""
+    spheres = np.asarray(spheres, dtype='float64').reshape(-1, 4)
+    low = (spheres[:, :3] - spheres[:, 3:]).min(axis=0)
+    high = (spheres[:, :3] + spheres[:, 3:]).max(axis=0)
+    center = (low + high) / 2.
+    radius = (
+        np.sqrt(((spheres[:, :3] - center) ** 2).sum(axis=1)) +
+        spheres[:, 3]).max()
+    return np.append(center, radius)
+
+
+class LightManager(object):
+    """Positions and ranges of the lights of a scene.
+
+    :attr:`version` changes with the lights, so the uniforms built from
+    them can be kept until then.
+    """
+    def __init__(self, max_lights=MAX_LIGHTS):
+        self.max_lights = max_lights
+        self.positions = np.zeros((0, 4))
+        self.ranges = np.zeros(0)
+        self.version = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def set_lights(self, lights, default_range=0):
+        """Set the lights from a list of [x, y, z, w] positions, optionally
+        followed by a range, ``default_range`` otherwise."""
+        lights = [list(light) for light in lights]
+        self.positions = np.array(
+            [light[:4] for light in lights], dtype='float64').reshape(-1, 4)
+        self.ranges = np.array([
+            light[4] if len(light) > 4 else default_range
+            for light in lights], dtype='float64')
+        self.version += 1
+
+    def select(self, spheres):
+        """Return, for each of the (N, 4) ``spheres``, or None for objects
+        without bounds, the numbers of the lights reaching it, nearest
+        first, at most :attr:`max_lights`."""
+        count = len(self.positions)
+        if not count:
+            return [[] for sphere in spheres]
+        bounded = [
+            i for i, sphere in enumerate(spheres) if sphere is not None]
+        everywhere = list(range(min(count, self.max_lights)))
+        selected = [everywhere] * len(spheres)
+        if not bounded:
+            return selected
+
+        centers = np.array(
+            [spheres[i] for i in bounded], dtype='float64').reshape(-1, 4)
+        # distance from each light to the nearest point of each sphere
+        distances = np.maximum(np.sqrt((
+            (centers[:, None, :3] - self.positions[None, :, :3]) ** 2
+        ).sum(axis=2)) - centers[:, 3:], 0)
+        reaches = (self.ranges <= 0) | (distances <= self.ranges)
+        distances = np.where(reaches, distances, np.inf)
+        order = np.argsort(distances, axis=1, kind='stable')[
+            :, :self.max_lights]
+        for i, lights, reached in zip(
+                bounded, order, np.take_along_axis(reaches, order, axis=1)):
+            selected[i] = lights[reached].tolist()
+        return selected
+
+    def uniforms(self, lights):
+        """Return the light_sources, light_ranges and nb_lights uniforms of
+        the shader giving it lights ``lights``."""
+        # the shader arrays can't be empty
+        return dict(
+            light_sources=[
+                [float(x) for x in self.positions[i]] for i in lights] or
+            [[0., 0., 0., 1.]],
+            # in vec4s, kivy has no float arrays
+            light_ranges=[
+                [float(self.ranges[i]), 0., 0., 0.] for i in lights] or
+            [[0., 0., 0., 0.]],
+            nb_lights=len(lights))
@@ -0,0 +1,289 @@
+'''On-disk cache of the buffers built by the loaders.
+
+Entries hold the final vertex and index buffers of every object of a
+scene and of their levels of detail, as .npy files that are memory mapped
+when read back, along with their vertex format, quantization ranges,
+material and texture in a json file. They are keyed on
+the source path, modification time and size, the loader and its options,
+so a modified source file gets a new entry. The modification time and
+size of the material libraries a .obj source refers to are kept in the
+entry, which is dropped when they change.
+
+Entries can also hold a json index of the source instead, such as the
+object offsets of :func:`lazyobj.scan_objects`, see
+:meth:`MeshCache.load_index`.
+'''
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from os.path import (
+    abspath, dirname, exists, expanduser, getmtime, getsize, join)
+
+import numpy as np
+
+from objloader import MeshData, _read_chunks
+
+# bump when the layout of the entries changes
+CACHE_VERSION = 5
+
+# material attributes of MeshData kept with the buffers
+MATERIAL_ATTRIBUTES = (
+    'ambient_color', 'diffuse_color', 'specular_color',
+    'specular_coefficent', 'transparency')
+
+# bounding volumes of MeshData, so they aren't computed again on read
+BOUNDS_ATTRIBUTES = ('aabb', 'bounding_sphere')
+
+_MTLLIB = re.compile(br'^[ \t]*mtllib[ \t]+(\S+)', re.M)
+
+
+def material_libraries(source):
+    """Return the paths of the material libraries named by the mtllib
+    records of .obj file ``source``, in the order they appear."""
+    paths = []
+    if not source.lower().endswith('.obj'):
+        return paths
+    with open(source, 'rb') as f:
+        for block in _read_chunks(f):
+            if b'mtllib' not in block:
+                continue
+            for name in _MTLLIB.findall(block):
+                path = join(dirname(source), name.decode('utf-8'))
+                if path not in paths:
+                    paths.append(path)
+    return paths
+
+
+def _stamp(path):
+    """Return the [path, modification time, size] of file ``path``, the
+    latter two None if it doesn't exist."""
+    if not exists(path):
+        return [path, None, None]
+    return [path, getmtime(path), getsize(path)]
+
+
+class CachedScene(object):
+    """Scene read back from a :class:`MeshCache` entry, with the same
+    ``objects`` dict as the loader it was built with."""
+    def __init__(self, source, objects):
+        self.source = source
+        self.objects = objects
+
+
+class MeshCache(object):
+    """Directory of cached scenes, bounded to ``max_size`` bytes.
+
+    When the entries grow over ``max_size``, the least recently used ones
+    are removed.
+    """
+    def __init__(self, directory=None, max_size=1024 * 1024 * 1024):
+        if directory is None:
+            directory = join(
+                os.environ.get('XDG_CACHE_HOME', expanduser('~/.cache')),
+                'kivy-garden-ddd')
+        self.directory = directory
+        self.max_size = max_size
+        if not exists(directory):
+            os.makedirs(directory)
+
+    def key(self, source, loader, **options):
+        """Return the name of the entry of ``source`` loaded by ``loader``
+        with ``options``."""
+        source = abspath(source)
+        description = json.dumps([
+            CACHE_VERSION, source, getmtime(source), getsize(source),
+            '%s.%s' % (loader.__module__, loader.__name__),
+            sorted(options.items())])
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def load(self, source, loader, progress=None, stats=None, **options):
+        """Return the scene of ``source``, read from the cache if possible,
+        or else loaded with ``loader(source, **options)`` and stored.
+
+        ``progress`` and ``stats`` are given to the loader, they aren't
+        part of the key; reading the cache is timed in ``stats`` as stage
+        'cache_read'.
+        """
+        key = self.key(source, loader, **options)
+        if stats is None:
+            scene = self.read(key)
+        else:
+            with stats.stage('cache_read'):
+                scene = self.read(key)
+            options['stats'] = stats
+        if scene is None:
+            scene = loader(source, progress=progress, **options)
+            self.store(key, source, scene)
+            self.evict()
+        return scene
+
+    def load_index(self, source, scan, **options):
+        """Return the json serializable index of ``source`` built by
+        ``scan(source, **options)``, read from the cache if possible, or
+        else built and stored."""
+        key = self.key(source, scan, **options)
+        path = join(self.directory, key)
+        try:
+            with open(join(path, 'index.json')) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            os.utime(join(path, 'meta.json'), None)
+            return index
+
+        index = scan(source, **options)
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+        try:
+            with open(join(tmp, 'index.json'), 'w') as f:
+                json.dump(index, f)
+            # an entry without objects, evicted like the others
+            with open(join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'source': abspath(source), 'objects': []}, f)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return index
+
+    def read(self, key):
+        """Return the :class:`CachedScene` of entry ``key``, or None.
+
+        The entry is removed if one of the material libraries of its source
+        changed since it was stored.
+        """
+        path = join(self.directory, key)
+        try:
+            with open(join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        materials = meta.get('materials', [])
+        if any(_stamp(stamp[0]) != stamp for stamp in materials):
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        objects = {}
+        for i, (obj_id, desc) in enumerate(meta['objects']):
+            mesh = MeshData(name=desc['name'])
+            mesh.vertex_format = [
+                (str(name), size, str(kind))
+                for name, size, kind in desc['vertex_format']]
+            # copy on write mappings, as Mesh wants writable buffers
+            mesh.vertices = np.load(
+                join(path, '%d.vertices.npy' % i), mmap_mode='c')
+            mesh.indices = np.load(
+                join(path, '%d.indices.npy' % i), mmap_mode='c')
+            mesh.texture = desc['texture']
+            mesh.quantization = desc['quantization']
+            mesh.lods = [
+                (np.load(join(path, '%d.lod%d.vertices.npy' % (i, level)),
+                         mmap_mode='c'),
+                 np.load(join(path, '%d.lod%d.indices.npy' % (i, level)),
+                         mmap_mode='c'),
+                 error)
+                for level, error in enumerate(desc['lods'])]
+            for attr, value in desc['material'].items():
+                setattr(mesh, str(attr), value)
+            for attr, value in desc['bounds'].items():
+                setattr(mesh, str(attr), value)
+            objects[obj_id] = mesh
+
+        # the modification time of the entry tells when it was last used
+        os.utime(join(path, 'meta.json'), None)
+        return CachedScene(meta['source'], objects)
+
+    def store(self, key, source, scene):
+        """Write the objects of ``scene``, loaded from ``source``, as entry
+        ``key``."""
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+        try:
+            objects = []
+            for i, (obj_id, mesh) in enumerate(scene.objects.items()):
+                np.save(join(tmp, '%d.vertices.npy' % i),
+                        np.asarray(mesh.vertices, dtype='float32'))
+                np.save(join(tmp, '%d.indices.npy' % i),
+                        np.asarray(mesh.indices, dtype='uint32'))
+                lods = getattr(mesh, 'lods', [])
+                for level, (vertices, indices, error) in enumerate(lods):
+                    np.save(join(tmp, '%d.lod%d.vertices.npy' % (i, level)),
+                            np.asarray(vertices, dtype='float32'))
+                    np.save(join(tmp, '%d.lod%d.indices.npy' % (i, level)),
+                            np.asarray(indices, dtype='uint32'))
+                objects.append((obj_id, {
+                    'name': getattr(mesh, 'name', None),
+                    'vertex_format': mesh.vertex_format,
+                    'texture': mesh.texture,
+                    'quantization': getattr(mesh, 'quantization', None),
+                    'lods': [error for vertices, indices, error in lods],
+                    'material': dict(
+                        (attr, getattr(mesh, attr))
+                        for attr in MATERIAL_ATTRIBUTES
+                        if hasattr(mesh, attr)),
+                    'bounds': dict(
+                        (attr, getattr(mesh, attr))
+                        for attr in BOUNDS_ATTRIBUTES
+                        if getattr(mesh, attr, None) is not None)}))
+
+            # found again here rather than in the key, so reading an entry
+            # doesn't read the whole source
+            materials = [
+                _stamp(path) for path in material_libraries(abspath(source))]
+            with open(join(tmp, 'meta.json'), 'w') as f:
+                json.dump({
+                    'source': abspath(source),
+                    'materials': materials,
+                    'objects': objects}, f)
+            os.rename(tmp, join(self.directory, key))
+        except OSError:
+            # another process stored the same entry meanwhile
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def entries(self):
+        """Return the (last use, size, key, source) of all entries, least
+        recently used first."""
+        entries = []
+        for key in os.listdir(self.directory):
+            path = join(self.directory, key)
+            try:
+                with open(join(path, 'meta.json')) as f:
+                    source = json.load(f)['source']
+                size = sum(getsize(join(path, n)) for n in os.listdir(path))
+                entries.append(
+                    (getmtime(join(path, 'meta.json')), size, key, source))
+            except (IOError, OSError, ValueError):
+                continue
+        return sorted(entries)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        :attr:`max_size`."""
+        # leftovers of interrupted stores
+        for name in os.listdir(self.directory):
+            path = join(self.directory, name)
+            if (name.startswith('.tmp') and
+                    getmtime(path) < time.time() - 3600):
+                shutil.rmtree(path, ignore_errors=True)
+
+        entries = self.entries()
+        total = sum(size for last_use, size, key, source in entries)
+        for last_use, size, key, source in entries:
+            if total <= self.max_size:
+                break
+            self.remove(key)
+            total -= size
+
+    def invalidate(self, source=None):
+        """Remove the entries of ``source``, or all entries if None."""
+        if source is not None:
+            source = abspath(source)
+        for last_use, size, key, entry_source in self.entries():
+            if source is None or entry_source == source:
+                self.remove(key)
+
+    def remove(self, key):
+        shutil.rmtree(join(self.directory, key), ignore_errors=True)
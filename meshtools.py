@@ -0,0 +1,737 @@
+'''Mesh processing helpers working on numpy vertex and index buffers, shared
+by the loaders.
+'''
+import numpy as np
+
+
+def first_unique(keys):
+    """Return the index of the first occurrence of each distinct key, in
+    order of appearance, and for each key the rank of its value in that
+    order.
+    """
+    if keys.dtype.kind == 'V':
+        # raw bytes only compare through sorting
+        _, first, inverse = np.unique(
+            keys, return_index=True, return_inverse=True)
+    else:
+        # an unstable sort is several times faster than the stable one of
+        # np.unique, the first occurrence of a key being the least index
+        # of its run
+        order = np.argsort(keys)
+        ordered = keys[order]
+        new = np.empty(len(keys), dtype=bool)
+        new[:1] = True
+        np.not_equal(ordered[1:], ordered[:-1], out=new[1:])
+        first = np.minimum.reduceat(order, np.flatnonzero(new))
+        inverse = np.empty_like(order)
+        inverse[order] = np.cumsum(new) - 1
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+
+def weld_vertices(vertices, indices, stride):
+    """Merge the identical vertices of an interleaved buffer.
+
+    Returns the (vertices, indices) pair where each distinct vertex is
+    stored once, in order of first appearance, and indices are remapped
+    accordingly.
+    """
+    # adding 0 turns -0.0 into 0.0, so they compare equal bytewise
+    rows = np.ascontiguousarray(vertices.reshape(-1, stride) + 0.0)
+    keys = rows.view(np.dtype((np.void, rows.itemsize * stride))).ravel()
+    first, rank = first_unique(keys)
+    return (
+        rows[first].reshape(-1),
+        rank[np.asarray(indices)].astype('uint32'))
+
+
+# number of vertices a Mesh can index, as Kivy uses 16 bits indices
+MAX_VERTICES = 2 ** 16
+
+
+def morton_order(points, bits=10):
+    """Return the order of ``points`` along a Z-order curve, which keeps
+    points that are close in space close in the order.
+    """
+    if not len(points):
+        return np.zeros(0, dtype='int64')
+    low = points.min(axis=0)
+    # same scale on all axes, so cells are cubes
+    extent = max((points.max(axis=0) - low).max(), 1e-12)
+    cells = ((points - low) / extent * (2 ** bits - 1)).astype('uint64')
+    codes = np.zeros(len(points), dtype='uint64')
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= (((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) <<
+                      np.uint64(3 * bit + axis))
+    return np.argsort(codes, kind='stable')
+
+
+def _split_point(triangles, max_vertices):
+    """Return how many of the leading ``triangles`` use at most
+    ``max_vertices`` distinct vertices."""
+    window = 2 * max_vertices
+    while True:
+        corners = triangles[:window].ravel()
+        new = np.zeros(len(corners), dtype=bool)
+        new[np.unique(corners, return_index=True)[1]] = True
+        used = np.cumsum(new.reshape(-1, 3).sum(axis=1))
+        end = np.searchsorted(used, max_vertices, 'right')
+        if end < len(used) or window >= len(triangles):
+            return end
+        window *= 2
+
+
+def vertex_positions(vertices, vertex_format, ranges=None):
+    """Return the positions of ``vertices`` as an (n, 3) array, dequantized
+    with ``ranges`` if they're packed, or None if they have none.
+
+    Without ``ranges``, packed positions are given in quantization steps,
+    which keep their order along each axis.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    rows = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    offset = attribute_offset(vertex_format, 'v_pos')
+    if offset is not None:
+        return rows[:, offset:offset + 3]
+    offset = attribute_offset(vertex_format, 'v_pos_q')
+    if offset is None:
+        return None
+    # quantization imports this module
+    from quantization import dequantize
+    if ranges is None:
+        ranges = {'pos_offset': (0, 0, 0), 'pos_scale': (1, 1, 1)}
+    positions, fmt = dequantize(
+        rows[:, offset:offset + 2], [('v_pos_q', 2, 'float')], ranges)
+    return positions.reshape(-1, 3)
+
+
+def split_triangles(vertices, indices, vertex_format,
+                    max_vertices=MAX_VERTICES, ranges=None):
+    """Return the triangles of each chunk :func:`split_mesh` cuts a mesh
+    into, as arrays of triangle numbers.
+
+    Triangles are ordered on their center, from the positions of
+    ``vertex_format``, dequantized with ``ranges`` if they're packed.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    vertices = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    if len(vertices) <= max_vertices:
+        return [np.arange(len(triangles))]
+
+    positions = vertex_positions(vertices, vertex_format, ranges)
+    if positions is None:
+        order = np.arange(len(triangles))
+    else:
+        order = morton_order(positions[triangles].mean(axis=1))
+    triangles = triangles[order]
+
+    parts = []
+    while len(triangles):
+        end = _split_point(triangles, max_vertices)
+        # triangles keep the order of the mesh, maybe optimized for the
+        # vertex cache
+        parts.append(np.sort(order[:end]))
+        order, triangles = order[end:], triangles[end:]
+    return parts
+
+
+def split_mesh(vertices, indices, vertex_format, max_vertices=MAX_VERTICES,
+               ranges=None):
+    """Split a mesh into chunks using at most ``max_vertices`` vertices each.
+
+    Returns a list of (vertices, indices) pairs, where each chunk has its
+    own vertex buffer and uint16 indices, and the number of vertices
+    duplicated because they are used by several chunks. Triangles are
+    grouped along a space filling curve, so chunks are compact and share
+    few vertices.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    vertices = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    if len(vertices) <= max_vertices:
+        return [
+            (vertices.reshape(-1), triangles.astype('uint16').ravel())], 0
+
+    chunks = []
+    for part in split_triangles(
+            vertices, triangles, vertex_format, max_vertices, ranges):
+        first, local = first_unique(triangles[part].ravel())
+        used = triangles[part].ravel()[first]
+        chunks.append((vertices[used].reshape(-1), local.astype('uint16')))
+
+    duplicated = sum(len(v) // stride for v, i in chunks) - len(vertices)
+    return chunks, duplicated
+
+
+def mesh_arguments(vertices, indices, vertex_format, ranges=None):
+    """Return the keyword arguments of the Mesh instructions drawing a mesh,
+    split so each one can be indexed with 16 bits, and the number of
+    vertices duplicated by the split.
+
+    ``ranges`` are the quantization ranges of packed vertices.
+
+    Raise ValueError if the vertices don't match ``vertex_format``.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    if len(vertices) % stride:
+        raise ValueError(
+            'vertices lenght (%s) is not a multiple of vertex_format '
+            'lenght (%s)' % (len(vertices), stride))
+    chunks, duplicated = split_mesh(
+        vertices, indices, vertex_format, ranges=ranges)
+    return [
+        dict(vertices=v, indices=i, fmt=vertex_format) for v, i in chunks
+    ], duplicated
+
+
+def merge_meshes(meshes, stride):
+    """Concatenate the (vertices, indices) of ``meshes`` in one mesh.
+
+    Returns its (vertices, indices) and for each of its triangles the
+    number of the mesh it comes from.
+    """
+    vertices = [
+        np.asarray(v, dtype='float32').reshape(-1, stride) for v, i in meshes]
+    triangles = [
+        np.asarray(i, dtype='int64').reshape(-1, 3) for v, i in meshes]
+    offsets = np.cumsum([0] + [len(v) for v in vertices])
+    owners = np.repeat(np.arange(len(meshes)), [len(t) for t in triangles])
+    return (
+        np.concatenate(vertices or [np.zeros((0, stride), 'float32')]),
+        np.concatenate([t + o for t, o in zip(triangles, offsets)] or
+                       [np.zeros((0, 3), 'int64')]).astype('uint32').ravel(),
+        owners)
+
+
+def attribute_offset(vertex_format, name):
+    """Return the offset of attribute ``name`` in vertices of
+    ``vertex_format``, or None if they don't have it."""
+    offset = 0
+    for attribute, size, kind in vertex_format:
+        if attribute == name:
+            return offset
+        offset += size
+
+
+def _unit(vectors):
+    length = np.sqrt((vectors ** 2).sum(axis=-1, keepdims=True))
+    # zero vectors stay zero
+    length[length == 0] = np.inf
+    return vectors / length
+
+
+def _creased_sums(keys, weights, units, threshold, max_pairs=1 << 22,
+                  max_degree=64):
+    """Sum the ``weights`` of the corners sharing a key whose face normal
+    ``units`` are within ``threshold`` (a cosine) of each corner's own.
+
+    Keys are processed by number of corners, comparing all the corners of
+    a key at once. Corners of keys shared by more than ``max_degree``
+    corners are compared with the average normal of the key instead.
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    degrees = np.diff(np.r_[starts, len(keys)])
+    units = units.astype('float32')
+
+    sums = np.empty_like(weights)
+    for degree in np.unique(degrees):
+        runs = starts[degrees == degree]
+        for batch in np.array_split(
+                runs, -(-len(runs) * degree * degree // max_pairs)):
+            corners = order[batch[:, None] + np.arange(degree)]
+            if degree > max_degree:
+                around = weights[corners]
+                average = around.sum(axis=1, keepdims=True)
+                close = (units[corners] * _unit(average)).sum(
+                    axis=-1) >= threshold
+                sums[corners] = np.where(close[..., None], average, around)
+                continue
+            u = units[corners]
+            close = np.matmul(u, u.transpose(0, 2, 1)) >= threshold
+            sums[corners] = np.matmul(
+                close.astype(weights.dtype), weights[corners])
+    return sums
+
+
+def corner_normals(positions, triangles, groups=None, crease_angle=None,
+                   weighting='area'):
+    """Compute smooth normals for the corners of ``triangles``.
+
+    ``triangles`` index ``positions``, the corners of triangles sharing a
+    position and a smoothing group (``groups`` gives one per triangle, 0
+    meaning flat) share their normal, the sum of the normals of the faces
+    around them weighted by the area of the face, or by the angle of the
+    face at the corner if ``weighting`` is 'angle'. With ``crease_angle``,
+    in degrees, only faces closer than that angle to each other's normal
+    are smoothed together.
+
+    Returns a (len(triangles), 3, 3) float32 array.
+    """
+    triangles = np.asarray(triangles, dtype='int64').reshape(-1, 3)
+    p = np.asarray(positions, dtype='float64')[triangles]
+    # length of the cross product is twice the area of the triangle
+    faces = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    units = _unit(faces)
+    if weighting == 'angle':
+        a = p[:, [1, 2, 0]] - p
+        b = p[:, [2, 0, 1]] - p
+        angles = np.arctan2(
+            np.sqrt((np.cross(a, b) ** 2).sum(axis=-1)),
+            (a * b).sum(axis=-1))
+        weights = units[:, None, :] * angles[..., None]
+    else:
+        weights = np.repeat(faces[:, None, :], 3, axis=1)
+    weights = weights.reshape(-1, 3)
+
+    if groups is None:
+        groups = np.ones(len(triangles), dtype='int64')
+    groups = np.asarray(groups)
+    group_values, group_ids = np.unique(groups, return_inverse=True)
+    keys = triangles.ravel() * len(group_values) + np.repeat(
+        group_ids.ravel(), 3)
+    key_count = len(positions) * len(group_values)
+    if key_count > 4 * len(keys):
+        keys = np.unique(keys, return_inverse=True)[1].ravel()
+        key_count = keys.max(initial=-1) + 1
+    smooth = np.repeat(groups != 0, 3)
+    if smooth.all():
+        smooth = slice(None)
+
+    normals = np.repeat(units, 3, axis=0)
+    if crease_angle is None:
+        sums = np.stack([
+            np.bincount(keys[smooth], weights[smooth, k], key_count)
+            for k in range(3)], axis=-1)
+        normals[smooth] = _unit(sums)[keys[smooth]]
+    else:
+        normals[smooth] = _unit(_creased_sums(
+            keys[smooth], weights[smooth], normals[smooth],
+            np.cos(np.radians(crease_angle))))
+
+    # degenerate neighbourhoods keep their face normal
+    flat = ~normals.any(axis=-1)
+    normals[flat] = np.repeat(units, 3, axis=0)[flat]
+    return normals.reshape(-1, 3, 3).astype('float32')
+
+
+def recalculate_normals(vertices, indices, vertex_format, crease_angle=None,
+                        weighting='area'):
+    """Replace the normals of an indexed mesh by smooth normals, see
+    :func:`corner_normals`; vertices at the same position are smoothed
+    together.
+
+    Returns the new (vertices, indices), vertices being split where they
+    get different normals and welded again.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    pos = attribute_offset(vertex_format, 'v_pos')
+    normal = attribute_offset(vertex_format, 'v_normal')
+    rows = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+
+    positions = np.ascontiguousarray(rows[:, pos:pos + 3] + 0.0)
+    first, position_ids = first_unique(
+        positions.view(np.dtype((np.void, 12))).ravel())
+    normals = corner_normals(
+        positions[first], position_ids[triangles], crease_angle=crease_angle,
+        weighting=weighting)
+
+    corners = rows[triangles.ravel()]
+    corners[:, normal:normal + 3] = normals.reshape(-1, 3)
+    return weld_vertices(corners, np.arange(len(corners)), stride)
+
+
+def bounding_volumes(vertices, stride, offset=0):
+    """Return the axis aligned box around the positions of ``vertices``,
+    found at ``offset`` in each vertex, as its (low, high) corners, and a
+    sphere around them as its (center, radius), centered on the box.
+    """
+    positions = np.asarray(vertices, dtype='float32').reshape(
+        -1, stride)[:, offset:offset + 3]
+    if not len(positions):
+        return ([0.0] * 3, [0.0] * 3), ([0.0] * 3, 0.0)
+    low = positions.min(axis=0)
+    high = positions.max(axis=0)
+    center = (low + high) / 2
+    radius = np.sqrt(((positions - center) ** 2).sum(axis=1).max())
+    return (low.tolist(), high.tolist()), (center.tolist(), float(radius))
+
+
+def _plane_quadrics(positions, triangles):
+    """Return the 10 coefficients (a11 a12 a13 a22 a23 a33 b1 b2 b3 c) of the
+    area weighted quadric of the plane of each triangle."""
+    p = positions[triangles]
+    normals = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    # weight by the area, half the length of the cross product
+    lengths = np.sqrt((normals ** 2).sum(axis=1))
+    units = normals / np.where(lengths > 0, lengths, 1)[:, None]
+    weights = lengths / 2
+    d = -(units * p[:, 0]).sum(axis=1)
+    x, y, z = units.T
+    return np.stack([
+        x * x, x * y, x * z, y * y, y * z, z * z,
+        x * d, y * d, z * d, d * d], axis=1) * weights[:, None]
+
+
+def _occupied_cells(positions, low, size):
+    """Return the distinct cells of a grid of cubes of ``size`` holding
+    ``positions``, and the cell of each position."""
+    cells = np.floor((positions - low) / size).astype('int64')
+    dims = cells.max(axis=0, initial=0) + 1
+    keys, inverse = np.unique(
+        np.ravel_multi_index(cells.T, dims), return_inverse=True)
+    return np.stack(np.unravel_index(keys, dims), axis=1), inverse.ravel()
+
+
+def _cluster_components(clusters, triangles):
+    """Return for each vertex the smallest vertex connected to it by edges
+    of ``triangles`` whose ends are both in the same cluster."""
+    edges = triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    edges = edges[clusters[edges[:, 0]] == clusters[edges[:, 1]]]
+    labels = np.arange(len(clusters))
+    while True:
+        low = np.minimum(labels[edges[:, 0]], labels[edges[:, 1]])
+        new = np.array(labels)
+        np.minimum.at(new, edges[:, 0], low)
+        np.minimum.at(new, edges[:, 1], low)
+        # jump to the label of the label, halving the paths
+        new = new[new]
+        if (new == labels).all():
+            return labels
+        labels = new
+
+
+def simplify(vertices, indices, vertex_format, cell_size):
+    """Simplify a mesh by clustering its vertices in a grid of cubes of
+    ``cell_size``, each cluster being moved to the position minimizing the
+    quadric error of the faces around it.
+
+    Only the vertices of a cluster connected by edges in it are merged, so
+    vertices on either side of a seam stay apart, though at the same
+    position; the other attributes of merged vertices are averaged.
+    Triangles collapsed by the clustering are removed.
+
+    Returns the (vertices, indices) of the simplified mesh.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    pos = attribute_offset(vertex_format, 'v_pos')
+    normal = attribute_offset(vertex_format, 'v_normal')
+    rows = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    if not len(triangles):
+        return rows.reshape(-1), triangles.astype('uint32').ravel()
+    positions = rows[:, pos:pos + 3].astype('float64')
+
+    low = positions.min(axis=0)
+    cells, clusters = _occupied_cells(positions, low, cell_size)
+    count = len(cells)
+
+    # sum the quadrics of the faces around each cluster
+    quadrics = _plane_quadrics(positions, triangles)
+    corner_clusters = clusters[triangles].ravel()
+    sums = np.stack([
+        np.bincount(corner_clusters, np.repeat(quadrics[:, k], 3), count)
+        for k in range(10)], axis=1)
+    a = sums[:, [0, 1, 2, 1, 3, 4, 2, 4, 5]].reshape(-1, 3, 3)
+    b = sums[:, 6:9]
+
+    # minimize from the mean of the cluster, ignoring the directions the
+    # quadric doesn't constrain, and stay in the cell
+    mean = np.stack([
+        np.bincount(clusters, positions[:, k], count)
+        for k in range(3)], axis=1) / np.bincount(clusters, None, count)[
+            :, None]
+    residual = -(b + np.matmul(a, mean[..., None])[..., 0])
+    optimal = mean + np.matmul(
+        np.linalg.pinv(a, rcond=1e-6), residual[..., None])[..., 0]
+    cell_low = low + cells * cell_size
+    optimal = np.clip(optimal, cell_low, cell_low + cell_size)
+
+    # vertices of a cluster only merge with those they are connected to
+    # in it, which keeps them apart along texture seams
+    first, ids = first_unique(_cluster_components(clusters, triangles))
+
+    counts = np.bincount(ids, None, len(first))[:, None]
+    result = np.stack([
+        np.bincount(ids, rows[:, k], len(first))
+        for k in range(stride)], axis=1) / counts
+    result[:, pos:pos + 3] = optimal[clusters[first]]
+    if normal is not None:
+        result[:, normal:normal + 3] = _unit(result[:, normal:normal + 3])
+
+    # drop the triangles whose corners share a cluster, and duplicates
+    kept = triangles[
+        (corner_clusters.reshape(-1, 3)[:, [0, 1, 2]] !=
+         corner_clusters.reshape(-1, 3)[:, [1, 2, 0]]).all(axis=1)]
+    kept = ids[kept]
+    # rotate each triangle to start with its smallest index, keeping its
+    # orientation, so duplicates compare equal
+    shift = kept.argmin(axis=1)
+    kept = kept[
+        np.arange(len(kept))[:, None], (shift[:, None] + [0, 1, 2]) % 3]
+    kept = np.ascontiguousarray(kept)
+    first_triangles, _ = first_unique(
+        kept.view(np.dtype((np.void, kept.itemsize * 3))).ravel())
+    kept = kept[np.sort(first_triangles)]
+    return result.astype('float32').reshape(-1), kept.astype('uint32').ravel()
+
+
+def build_lods(vertices, indices, vertex_format, ratios=(.25, .0625)):
+    """Return simplified versions of a mesh, keeping about each of
+    ``ratios`` of its vertices, as a list of (vertices, indices, error),
+    ``error`` being the size of the cells of :func:`simplify`, which bounds
+    how far the surface moved.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    pos = attribute_offset(vertex_format, 'v_pos')
+    positions = np.asarray(vertices, dtype='float32').reshape(
+        -1, stride)[:, pos:pos + 3].astype('float64')
+    if not len(positions):
+        return []
+    low = positions.min(axis=0)
+    extent = max((positions.max(axis=0) - low).max(), 1e-12)
+
+    # the number of occupied cells grows as a power of the resolution,
+    # about 2 for surfaces, measured to pick the cell size of each ratio
+    probe = extent / 64
+    coarse = len(_occupied_cells(positions, low, probe)[0])
+    fine = len(_occupied_cells(positions, low, probe / 2)[0])
+    power = max(np.log2(fine / float(coarse)), .5)
+    lods = []
+    for ratio in ratios:
+        target = max(ratio * len(positions), 4)
+        cell_size = probe * (coarse / target) ** (1 / power)
+        lod_vertices, lod_indices = simplify(
+            vertices, indices, vertex_format, cell_size)
+        if not len(lod_indices):
+            break
+        lods.append((lod_vertices, lod_indices, float(cell_size)))
+    return lods
+
+
+# vertices held by the post-transform cache of common GPUs
+CACHE_SIZE = 16
+# triangles acmr simulates at most, in a few runs over larger meshes
+ACMR_TRIANGLES = 1 << 16
+ACMR_RUNS = 8
+
+
+def acmr(indices, cache_size=CACHE_SIZE, max_triangles=ACMR_TRIANGLES):
+    """Return the average cache miss ratio of drawing triangles
+    ``indices``, the number of vertices transformed per triangle through a
+    FIFO cache of ``cache_size`` vertices: 3 at worst, about 0.5 at best
+    on large meshes.
+
+    Meshes of more than ``max_triangles`` triangles are sampled, the cache
+    is simulated on ACMR_RUNS runs of consecutive triangles spread over
+    them.
+    """
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    if not len(triangles):
+        return 0.
+    runs = [triangles]
+    if len(triangles) > max_triangles:
+        size = max_triangles // ACMR_RUNS
+        runs = [
+            triangles[start:start + size] for start in np.linspace(
+                0, len(triangles) - size, ACMR_RUNS).astype('int64')]
+    misses = 0
+    for run in runs:
+        # misses counted when each vertex last entered the cache
+        entered = {}
+        start = misses
+        for v in run.ravel().tolist():
+            if misses - entered.get(v, start - cache_size - 1) > cache_size:
+                entered[v] = misses
+                misses += 1
+    return misses / float(sum(len(run) for run in runs))
+
+
+def tipsify(indices, vertex_count, cache_size=CACHE_SIZE):
+    """Return the order of the triangles of ``indices`` keeping their
+    vertices in the post-transform cache, and where each cluster of
+    triangles starts in it, following Sander, Nehab and Barczak's Tipsify.
+
+    Triangles are emitted in fans around a vertex, the next one being the
+    vertex just used that stays longest in the cache while its remaining
+    triangles are emitted; clusters start where the fans have to jump to a
+    vertex out of the cache.
+    """
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    corners = triangles.ravel()
+    # triangles around each vertex
+    around = (np.argsort(corners, kind='stable') // 3).tolist()
+    counts = np.bincount(corners, minlength=vertex_count)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    live = counts.tolist()
+    corners = triangles.tolist()
+
+    emitted = [False] * len(corners)
+    # time each vertex entered the cache, time counting the misses
+    entered = [0] * vertex_count
+    time = cache_size + 1
+    order = []
+    clusters = [0]
+    dead_end = []
+    cursor = 0
+    fan = corners[0][0] if corners else -1
+    while fan >= 0:
+        candidates = []
+        for t in around[offsets[fan]:offsets[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            order.append(t)
+            for v in corners[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - entered[v] > cache_size:
+                    entered[v] = time
+                    time += 1
+
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v]:
+                age = time - entered[v]
+                # vertices evicted before their fan ends come last
+                priority = age if age + 2 * live[v] <= cache_size else 0
+                if priority > best:
+                    fan, best = v, priority
+        if fan < 0:
+            while dead_end and fan < 0:
+                v = dead_end.pop()
+                if live[v]:
+                    fan = v
+            while fan < 0 and cursor < vertex_count:
+                if live[cursor]:
+                    fan = cursor
+                cursor += 1
+            if fan >= 0:
+                clusters.append(len(order))
+    return np.array(order, dtype='int64'), np.array(clusters, dtype='int64')
+
+
+def sort_clusters(positions, triangles, clusters):
+    """Return the order of the triangles of ``triangles`` with the clusters
+    starting at ``clusters`` sorted to lower overdraw whatever the view:
+    the ones facing out of the mesh the most come first, as they tend to
+    hide the others."""
+    triangles = np.asarray(triangles, dtype='int64').reshape(-1, 3)
+    if len(clusters) < 2:
+        return np.arange(len(triangles))
+    p = np.asarray(positions, dtype='float64')[triangles]
+    # twice the area weighted normals and centers
+    faces = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    areas = np.sqrt((faces ** 2).sum(axis=1))
+    centers = p.mean(axis=1)
+    ids = np.repeat(
+        np.arange(len(clusters)),
+        np.diff(np.append(clusters, len(triangles))))
+    total = np.maximum(np.bincount(ids, areas), 1e-30)
+    cluster_centers = np.stack([
+        np.bincount(ids, centers[:, k] * areas) for k in range(3)],
+        axis=1) / total[:, None]
+    cluster_normals = _unit(np.stack([
+        np.bincount(ids, faces[:, k]) for k in range(3)], axis=1))
+    center = (centers * areas[:, None]).sum(axis=0) / max(areas.sum(), 1e-30)
+    facing = ((cluster_centers - center) * cluster_normals).sum(axis=1)
+    ranks = np.argsort(-facing, kind='stable')
+    return np.concatenate([
+        np.arange(clusters[c], clusters[c + 1] if c + 1 < len(clusters)
+                  else len(triangles)) for c in ranks])
+
+
+def optimize_indices(vertices, indices, vertex_format, cache_size=CACHE_SIZE):
+    """Return the (vertices, indices) of a mesh with its triangles
+    reordered for the post-transform cache by :func:`tipsify`, its
+    clusters by :func:`sort_clusters`, and its vertices in the order the
+    triangles first use them, for the pre-transform cache; unused vertices
+    are dropped.
+    """
+    stride = sum(size for name, size, kind in vertex_format)
+    rows = np.asarray(vertices, dtype='float32').reshape(-1, stride)
+    triangles = np.asarray(indices, dtype='int64').reshape(-1, 3)
+    if not len(triangles):
+        return rows.reshape(-1), triangles.astype('uint32').ravel()
+    order, clusters = tipsify(triangles, len(rows), cache_size)
+    triangles = triangles[order]
+    pos = attribute_offset(vertex_format, 'v_pos')
+    if pos is not None:
+        triangles = triangles[sort_clusters(
+            rows[:, pos:pos + 3], triangles, clusters)]
+    first, ranks = first_unique(triangles.ravel())
+    return (
+        rows[triangles.ravel()[first]].reshape(-1),
+        ranks.astype('uint32'))
+
+
+class MeshOperations(object):
+    """Methods processing the buffers of a mesh, shared by the meshes of
+    the loaders, which hold ``vertices``, ``indices``, ``vertex_format``,
+    ``lods`` and ``quantization``."""
+
+    def compute_bounds(self):
+        """Set the bounding box and sphere of the mesh from its vertices."""
+        self.aabb, self.bounding_sphere = bounding_volumes(
+            self.vertices, sum(x[1] for x in self.vertex_format),
+            attribute_offset(self.vertex_format, 'v_pos'))
+
+    def build_lods(self, ratios=(.25, .0625)):
+        """Build simplified versions of the mesh keeping about each of
+        ``ratios`` of its vertices, see :func:`meshtools.build_lods`."""
+        self.lods = build_lods(
+            self.vertices, self.indices, self.vertex_format, ratios)
+
+    def calculate_normals(self, crease_angle=None, weighting='area'):
+        """Replace the normals of the mesh by smooth normals computed from
+        its faces, see :func:`meshtools.corner_normals`."""
+        self.vertices, self.indices = recalculate_normals(
+            self.vertices, self.indices, self.vertex_format,
+            crease_angle, weighting)
+
+    def quantize(self, attributes=None):
+        """Pack ``attributes`` of the vertices, and of the levels of
+        detail, in a compact vertex format, see :mod:`quantization`, by
+        default all of quantization.QUANTIZABLE. Return their sizes before
+        and after and the errors, see
+        :func:`quantization.quantization_report`."""
+        # quantization imports this module
+        from quantization import QUANTIZABLE, quantization_report, quantize
+        if attributes is None:
+            attributes = QUANTIZABLE
+        vertices, vertex_format = self.vertices, self.vertex_format
+        self.vertices, self.vertex_format, self.quantization = quantize(
+            vertices, vertex_format, attributes)
+        # the levels of detail lie within the ranges of the mesh
+        self.lods = [
+            (quantize(lod_vertices, vertex_format, attributes,
+                      self.quantization)[0], lod_indices, error)
+            for lod_vertices, lod_indices, error in self.lods]
+        return quantization_report(
+            vertices, vertex_format, self.vertices, self.vertex_format,
+            self.quantization)
+
+    def optimize_indices(self, cache_size=CACHE_SIZE, measure=False):
+        """Reorder the triangles and vertices of the mesh, and of its
+        levels of detail, for the vertex caches, see
+        :func:`meshtools.optimize_indices`. With ``measure``, return the
+        average cache miss ratio of the mesh before and after."""
+        if measure:
+            before = acmr(self.indices, cache_size)
+        self.vertices, self.indices = optimize_indices(
+            self.vertices, self.indices, self.vertex_format, cache_size)
+        self.lods = [
+            optimize_indices(
+                lod_vertices, lod_indices, self.vertex_format, cache_size) +
+            (error, )
+            for lod_vertices, lod_indices, error in self.lods]
+        if measure:
+            return before, acmr(self.indices, cache_size)
@@ -1,24 +1,245 @@
+import logging
+
 from kivy.uix.widget import Widget
 from kivy.resources import resource_find
-try:
-    from assimpobjloader import AssimpObjLoader as ObjFileLoader
-except Exception as e:
-    print("Error trying to import assimp: %s, using simple objloader" %
-          e.message)
-    from objloader import ObjFileLoader
 
-from kivy.uix.image import Image
 from kivy.graphics.fbo import Fbo
 from kivy.graphics import (
     Callback, PushMatrix, PopMatrix, Rotate, Translate, Scale,
-    Rectangle, Color, Mesh, UpdateNormalMatrix, Canvas)
+    Rectangle, Color, Mesh, UpdateNormalMatrix, Canvas, ChangeState,
+    InstructionGroup, MatrixInstruction)
 from kivy.graphics.transformation import Matrix
 from kivy.graphics.opengl import (
     glEnable, glDisable, GL_DEPTH_TEST)
 from kivy.properties import (
     StringProperty, ListProperty, ObjectProperty, NumericProperty,
     BooleanProperty, DictProperty)
+from kivy.clock import Clock
 from os.path import join, dirname
+from functools import partial, reduce
+from threading import Thread
+
+import numpy as np
+
+from meshtools import (
+    MAX_VERTICES, attribute_offset, first_unique, merge_meshes,
+    mesh_arguments, split_triangles)
+from bvh import BVH, ray_boxes
+import frustum
+import lazyobj
+from lights import LightManager, enclosing_sphere
+from quantization import dequantize
+import texturecache
+from scenegraph import SceneGraph
+from stats import Stats
+
+logger = logging.getLogger(__name__)
+
+try:
+    from assimpobjloader import AssimpObjLoader as ObjFileLoader
+except Exception as e:
+    logger.warning(
+        "ObjectRenderer: error trying to import assimp: %s, using simple "
+        "objloader", e)
+    from objloader import ObjFileLoader
+
+
+class _LoadCancelled(Exception):
+    pass
+
+
+def _set_angle(rotate, angle):
+    # changing an instruction redraws the canvas, even to the same value
+    if rotate.angle != angle:
+        rotate.angle = angle
+
+
+def _set_xyz(instruction, xyz):
+    if tuple(instruction.xyz) != tuple(xyz):
+        instruction.xyz = xyz
+
+
+def _kivy_matrix(matrix):
+    m = Matrix()
+    # kivy matrices are stored column by column
+    m.set(flat=np.asarray(matrix, dtype='float64').T.ravel().tolist())
+    return m
+
+
+def _ranges_key(m):
+    ranges = getattr(m, 'quantization', None) or {}
+    return tuple(sorted(
+        (name, tuple(value)) for name, value in ranges.items()))
+
+
+class _DrawnObject(object):
+    """Retained instructions of an object: its group, its transform once
+    it's moved, a group holding the meshes of its current level of detail,
+    and the meshes of the levels used so far."""
+    def __init__(self, group, texture):
+        self.group = group
+        self.mesh_group = InstructionGroup()
+        group.add(self.mesh_group)
+        self.transform = None
+        # (placement, ChangeState, count) of its lights, see _assign_lights
+        self.lit = None
+        self.texture = texture
+        # source of the texture it holds a reference on, and whether it was
+        # discarded, releasing it
+        self.source = None
+        self.removed = False
+        self.level = None
+        self.levels = {}
+        # (meshes, vertices, indices) of each level
+        self.sizes = {}
+
+    def meshes(self):
+        return [mesh for meshes in self.levels.values() for mesh in meshes]
+
+    def size(self):
+        return self.sizes.get(self.level, (0, 0, 0))
+
+    def set_matrix(self, matrix):
+        """Transform the meshes by numpy ``matrix``."""
+        if self.transform is None:
+            # objects never moved draw without transforms
+            self.transform = MatrixInstruction()
+            self.group.remove(self.mesh_group)
+            for instruction in (
+                    PushMatrix(), self.transform, UpdateNormalMatrix(),
+                    self.mesh_group, PopMatrix()):
+                self.group.add(instruction)
+        self.transform.matrix = _kivy_matrix(matrix)
+
+
+class _Batch(object):
+    """Objects sharing their texture and material, merged in the meshes of
+    ``drawn``, with the (mesh, indices, owners) of each of them, ``owners``
+    giving the number of the object of each triangle in ``obj_ids``."""
+    def __init__(self, drawn, obj_ids, parts):
+        self.drawn = drawn
+        self.group = drawn.group
+        self.obj_ids = obj_ids
+        self.parts = parts
+        self.shown = None
+        # indices of each part number its vertices from 0
+        self.vertices = sum(
+            int(indices.max()) + 1 for mesh, indices, owners in parts
+            if len(indices))
+        self.indices = 0
+
+    def show(self, visible):
+        """Only draw the triangles of the objects in set ``visible``."""
+        shown = np.array([obj_id in visible for obj_id in self.obj_ids])
+        if self.shown is not None and (shown == self.shown).all():
+            return
+        self.shown = shown
+        self.indices = 0
+        for mesh, indices, owners in self.parts:
+            kept = shown[owners]
+            if kept.all():
+                mesh.indices = indices
+            else:
+                mesh.indices = indices.reshape(-1, 3)[kept].ravel()
+            self.indices += 3 * int(kept.sum())
+
+    def size(self):
+        return len(self.parts), self.vertices, self.indices
+
+
+class _Copy(object):
+    """Group drawing one copy of :class:`_Instances`, with its transform,
+    its tint ChangeState and its lights, see
+    :meth:`ObjectRenderer._assign_lights`."""
+    def __init__(self, drawn):
+        self.group = InstructionGroup()
+        self.transform = MatrixInstruction()
+        self.tint = None
+        self.lit = None
+        for instruction in (
+                PushMatrix(), self.transform, UpdateNormalMatrix(),
+                drawn.group, PopMatrix()):
+            self.group.add(instruction)
+
+    def set_tint(self, tint):
+        # a ChangeState is replaced, it can't be changed once built
+        if self.tint is not None:
+            self.group.remove(self.tint)
+        self.tint = ChangeState(
+            instance_tint=tuple(float(x) for x in tint))
+        self.group.insert(0, self.tint)
+
+
+class _Instances(object):
+    """Copies of object ``obj_id`` drawing the meshes of ``drawn``, each
+    in a :class:`_Copy` setting its transform and tint before them. The
+    meshes are those of the object, so its buffers are shared by the
+    object and all the copies."""
+    def __init__(self, obj_id, drawn):
+        self.obj_id = obj_id
+        self.drawn = drawn
+        self.matrices = np.zeros((0, 4, 4))
+        self.tints = np.zeros((0, 4))
+        self.copies = []
+        # numbers of the copies drawn, and their groups
+        self.shown = []
+        self.groups = []
+
+    def set(self, matrices=None, tints=None):
+        """Update the (N, 4, 4) ``matrices`` and (N, 4) rgba ``tints`` of
+        the copies, only changing the instructions of those that differ."""
+        if matrices is None:
+            matrices = self.matrices
+        matrices = np.array(matrices, dtype='float64').reshape(-1, 4, 4)
+        count = len(matrices)
+        if tints is None:
+            tints = self.tints[:count]
+            if len(tints) < count:
+                tints = np.concatenate(
+                    [tints, np.ones((count - len(tints), 4))])
+        tints = np.array(tints, dtype='float64').reshape(-1, 4)
+        if len(tints) != count:
+            raise ValueError(
+                '%s tints for %s instances' % (len(tints), count))
+
+        kept = min(count, len(self.copies))
+        changed = np.flatnonzero(
+            (matrices[:kept] != self.matrices[:kept]).any(axis=(1, 2)))
+        tinted = np.flatnonzero(
+            (tints[:kept] != self.tints[:kept]).any(axis=1))
+        del self.copies[count:]
+        self.copies.extend(_Copy(self.drawn) for i in range(kept, count))
+        added = np.arange(kept, count)
+
+        for i in np.concatenate([changed, added]):
+            self.copies[i].transform.matrix = _kivy_matrix(matrices[i])
+        for i in np.concatenate([tinted, added]):
+            self.copies[i].set_tint(tints[i])
+        self.matrices = matrices
+        self.tints = tints
+
+    def show(self, planes, box, sphere):
+        """Set :attr:`shown` to the copies inside frustum ``planes``, or to
+        all of them without planes, the object having bounding ``box`` and
+        ``sphere``, or None."""
+        if planes is None or box is None or not len(self.matrices):
+            shown = range(len(self.copies))
+        else:
+            count = len(self.matrices)
+            inside = frustum.visible(
+                planes,
+                frustum.transform_boxes(self.matrices, np.tile(
+                    box, (count, 1, 1))),
+                frustum.transform_spheres(self.matrices, np.tile(
+                    sphere, (count, 1))))
+            shown = np.flatnonzero(inside)
+        self.shown = list(shown)
+        self.groups = [self.copies[i].group for i in shown]
+
+    def size(self):
+        meshes, vertices, indices = self.drawn.size()
+        count = len(self.groups)
+        return meshes * count, vertices * count, indices * count
 
 
 class ObjectRenderer(Widget):
@@ -32,13 +253,103 @@ class ObjectRenderer(Widget):
     cam_translation = ListProperty([0, 0, 0])
     cam_rotation = ListProperty([0, 0, 0])
     display_all = BooleanProperty(False)
+    # [x, y, z, w] positions of the lights, in the coordinates of the
+    # scene, optionally followed by their range
     light_sources = DictProperty()
+    # range of the lights not giving theirs, 0 to light everything
+    light_range = NumericProperty(0)
     ambiant = NumericProperty(.5)
     diffuse = NumericProperty(.5)
     specular = NumericProperty(.5)
     mode = StringProperty('triangles')
+    # MeshCache to read scenes from, instead of parsing them on every load
+    mesh_cache = ObjectProperty(None, allownone=True)
+    # only index the objects of .obj files at load time, each one is parsed
+    # when first drawn, see lazyobj
+    lazy_load = BooleanProperty(False)
+    # load scenes in a background thread, the ui keeps running meanwhile
+    async_load = BooleanProperty(False)
+    loading = BooleanProperty(False)
+    progress = NumericProperty(0)
+    # TextureCache the textures of the meshes are taken from
+    texture_cache = ObjectProperty(texturecache.texture_cache)
+    # decode textures in the background, meshes are drawn without their
+    # texture until it's ready
+    async_textures = BooleanProperty(False)
+    # only draw the objects whose bounding volumes are in the view
+    frustum_culling = BooleanProperty(True)
+    # ratios of vertices kept by the levels of detail built at load time
+    lod_ratios = ListProperty([])
+    # reorder the triangles and vertices of the meshes at load time for the
+    # vertex caches of the GPU
+    optimize_indices = BooleanProperty(False)
+    # attributes of the vertices packed in a compact format by the
+    # loaders, among quantization.QUANTIZABLE
+    quantize = ListProperty([])
+    # largest error, in pixels, of the level of detail objects are drawn
+    # with, 0 to always draw them at full resolution
+    lod_threshold = NumericProperty(1.)
+    # fraction of lod_threshold by which the error must change before the
+    # level does, so it doesn't flicker around a threshold
+    lod_hysteresis = NumericProperty(.25)
+    # with display_all, merge the objects sharing a texture and material in
+    # a few large meshes, drawn at full resolution
+    batching = BooleanProperty(False)
+    # ids of objects not to draw
+    hidden_objects = ListProperty([])
+    # called with the name of each stage timed in stats, returns a context
+    # manager wrapping it, to plug a sampling profiler
+    profiler = ObjectProperty(None, allownone=True)
+
+    __events__ = (
+        'on_load_start', 'on_load_complete', 'on_load_error', 'on_stats')
+
+    _scene = None
+    _load_id = 0
+    _canvas_id = 0
 
     def __init__(self, **kwargs):
+        # sources of the textures taken from the cache by the canvas
+        self._textures = []
+        # retained instructions of the objects, built the first time they
+        # are shown
+        self._objects = {}
+        self._shown = None
+        self._batches = None
+        # objects merged in the batches
+        self._batched = set()
+        self._projection = None
+        # objects shown after hiding and culling, that can be picked
+        self._visible = []
+        # hierarchies of the triangles of the objects of the scene, built
+        # when first picked
+        self._bvhs = {}
+        # transforms of the objects, relative to the scene, and the
+        # objects they move
+        self.scene_graph = SceneGraph()
+        self._moved = set()
+        # copies of objects drawn with their meshes, by name
+        self._instances = {}
+        # (meshes, size) of each (obj_id, level), shared by the object and
+        # its instances
+        self._meshes = {}
+        # drawn after the instances, resetting their tint
+        self._untinted = ChangeState(instance_tint=(1., 1., 1., 1.))
+        # each object is drawn with the lights reaching it only
+        self.lights = LightManager()
+        self._view_mat = None
+        # changed when objects or instances move
+        self._placements = 0
+        self._trigger_transforms = Clock.create_trigger(
+            self.update_transforms)
+        # last values given to the uniforms of the shader
+        self._uniforms = {}
+        # time spent in the stages of the last scene load, and counters of
+        # what is drawn, see on_stats
+        self.stats = Stats()
+        # visibility is updated once per frame at most, when the view
+        # changed
+        self._trigger_culling = Clock.create_trigger(self.update_visibility)
         self.canvas = Canvas()
         with self.canvas:
             self.fbo = Fbo(size=self.size,
@@ -53,66 +364,788 @@ class ObjectRenderer(Widget):
         super(ObjectRenderer, self).__init__(**kwargs)
 
     def on_obj_rotation(self, *args):
-        self.obj_rot_x.angle = self.obj_rotation[0]
-        self.obj_rot_y.angle = self.obj_rotation[1]
-        self.obj_rot_z.angle = self.obj_rotation[2]
+        if self._scene is None:
+            # setup_scene makes the transforms from the properties once a
+            # scene is loaded
+            return
+        _set_angle(self.obj_rot_x, self.obj_rotation[0])
+        _set_angle(self.obj_rot_y, self.obj_rotation[1])
+        _set_angle(self.obj_rot_z, self.obj_rotation[2])
+        self._trigger_culling()
 
     def on_cam_rotation(self, *args):
-        self.cam_rot_x.angle = self.cam_rotation[0]
-        self.cam_rot_y.angle = self.cam_rotation[1]
-        self.cam_rot_z.angle = self.cam_rotation[2]
+        if self._scene is None:
+            return
+        _set_angle(self.cam_rot_x, self.cam_rotation[0])
+        _set_angle(self.cam_rot_y, self.cam_rotation[1])
+        _set_angle(self.cam_rot_z, self.cam_rotation[2])
+        self._trigger_culling()
 
     def on_obj_translation(self, *args):
-        self.obj_translate.xyz = self.cam_translation
+        if self._scene is None:
+            return
+        _set_xyz(self.obj_translate, self.obj_translation)
+        self._trigger_culling()
 
     def on_cam_translation(self, *args):
-        self.cam_translate.xyz = self.cam_translation
+        if self._scene is None:
+            return
+        _set_xyz(self.cam_translate, self.cam_translation)
+        self._trigger_culling()
 
     def on_obj_scale(self, *args):
-        self.scale.xyz = [self.obj_scale, ] * 3
+        if self._scene is None:
+            return
+        _set_xyz(self.scale, [self.obj_scale, ] * 3)
+        self._trigger_culling()
+
+    def on_frustum_culling(self, *args):
+        self._trigger_culling()
+
+    def on_lod_threshold(self, *args):
+        self._trigger_culling()
+
+    def on_batching(self, *args):
+        self._trigger_culling()
+
+    def on_hidden_objects(self, *args):
+        self._trigger_culling()
 
     def on_display_all(self, *args):
-        self.setup_canvas()
+        self.update_visibility()
+
+    def on_profiler(self, *args):
+        self.stats.profiler = self.profiler
+
+    def set_uniform(self, name, value):
+        """Set uniform ``name`` of the shader to ``value``, if it changed,
+        as setting it redraws the fbo."""
+        if self._uniforms.get(name) != value:
+            self._uniforms[name] = value
+            self.fbo[name] = value
 
     def on_light_sources(self, *args):
-        self.fbo['light_sources'] = [
-            ls[:] for ls in self.light_sources.values()]
-        self.fbo['nb_lights'] = len(self.light_sources)
+        self.lights.set_lights(
+            list(self.light_sources.values()), self.light_range)
+        self._trigger_culling()
+
+    def on_light_range(self, *args):
+        self.on_light_sources()
 
     def on_ambiant(self, *args):
-        self.fbo['ambiant'] = self.ambiant
+        self.set_uniform('ambiant', self.ambiant)
 
     def on_diffuse(self, *args):
-        self.fbo['diffuse'] = self.diffuse
+        self.set_uniform('diffuse', self.diffuse)
 
     def on_specular(self, *args):
-        self.fbo['specular'] = self.specular
+        self.set_uniform('specular', self.specular)
 
     def on_mode(self, *args):
-        self.setup_canvas()
+        drawn_objects = list(self._objects.values())
+        if self._batches:
+            drawn_objects += [batch.drawn for batch in self._batches]
+        drawn_objects += [
+            instances.drawn for instances in self._instances.values()]
+        for drawn in drawn_objects:
+            for mesh in drawn.meshes():
+                mesh.mode = self.mode
 
     def setup_canvas(self, *args):
-        if not (self.scene and self.obj_id or self.display_all):
+        """Build the instructions drawing the scene, replacing the previous
+        ones. Only needed when the scene changes, other properties update
+        the existing instructions."""
+        if self._scene is None:
             return
 
-        print 'setting up the scene'
+        logger.debug('ObjectRenderer: setting up the scene')
+        self._canvas_id += 1
+        self.stats.count('rebuilds')
+        # textures of the previous canvas are released once the new one
+        # took its own, so the shared ones stay in the cache
+        held, self._textures = self._textures, []
+        self._objects = {}
+        self._shown = None
+        self._batches = None
+        self._batched = set()
+        self._instances = {}
+        self._meshes = {}
+        self.fbo.clear()
         with self.fbo:
-            self.fbo['ambiant'] = self.ambiant
-            self.fbo['diffuse'] = self.diffuse
-            self.fbo['specular'] = self.specular
+            self.set_uniform('instance_tint', (1., 1., 1., 1.))
+            self.set_uniform('ambiant', self.ambiant)
+            self.set_uniform('diffuse', self.diffuse)
+            self.set_uniform('specular', self.specular)
             self.cb = Callback(self.setup_gl_context)
             PushMatrix()
             self.setup_scene()
             PopMatrix()
             self.cb = Callback(self.reset_gl_context)
 
+        self.update_visibility()
+        for source in held:
+            self.texture_cache.release(source)
+
+        # meshes are uploaded when first drawn, draw them now to time it
+        with self.stats.stage('upload'):
+            self.fbo.draw()
+
+    def load_scene(self, source, progress=None, stats=None):
+        """Return the loaded scene of file ``source``, ``progress`` is
+        called with the fraction of the file parsed so far, the time spent
+        in each stage is added to ``stats``."""
+        options = {}
+        if self.lod_ratios:
+            options['lod_ratios'] = tuple(self.lod_ratios)
+        if self.optimize_indices:
+            options['optimize_indices'] = True
+        if self.quantize:
+            options['quantize'] = tuple(self.quantize)
+        if stats is not None:
+            options['stats'] = stats
+        if self.lazy_load and source.lower().endswith('.obj'):
+            return lazyobj.LazyObjFileLoader(
+                source, mesh_cache=self.mesh_cache, progress=progress,
+                **options)
+        if self.mesh_cache:
+            return self.mesh_cache.load(
+                source, ObjFileLoader, progress=progress, **options)
+        return ObjFileLoader(source, progress=progress, **options)
+
     def on_scene(self, instance, value):
-        print "loading scene %s" % value
-        self._scene = ObjFileLoader(resource_find(value))
+        logger.info("ObjectRenderer: loading scene %s", value)
+        # a newer load supersedes any load still running
+        self._load_id += 1
+        load_id = self._load_id
+        self.loading = True
+        self.progress = 0
+        self.dispatch('on_load_start', value)
+        # timings of this load only, a superseded one may still add to its
+        # own
+        stats = Stats(self.profiler)
+
+        if not self.async_load:
+            try:
+                scene = self.load_scene(resource_find(value), stats=stats)
+            except Exception as e:
+                self._finish_load(load_id, None, e, stats)
+                return
+            self._finish_load(load_id, scene, None, stats)
+            return
+
+        thread = Thread(
+            target=self._load_scene_thread,
+            args=(resource_find(value), load_id, stats))
+        thread.daemon = True
+        thread.start()
+
+    def _load_scene_thread(self, source, load_id, stats):
+        def progress(value):
+            if load_id != self._load_id:
+                raise _LoadCancelled()
+            Clock.schedule_once(
+                partial(self._update_progress, load_id, value))
+
+        try:
+            scene = self.load_scene(source, progress, stats)
+        except _LoadCancelled:
+            return
+        except Exception as e:
+            Clock.schedule_once(
+                partial(self._finish_load, load_id, None, e, stats))
+            return
+        # the canvas can only be built in the main thread
+        Clock.schedule_once(
+            partial(self._finish_load, load_id, scene, None, stats))
+
+    def _update_progress(self, load_id, value, *args):
+        if load_id == self._load_id:
+            self.progress = value
+
+    def _finish_load(self, load_id, scene, error, stats, *args):
+        if load_id != self._load_id:
+            return
+
+        self.loading = False
+        if error is not None:
+            logger.error(
+                "ObjectRenderer: error loading scene %s, %s", self.scene,
+                error)
+            self.dispatch('on_load_error', error)
+            return
+
+        self.stats.timings.clear()
+        self.stats.update(stats)
+        if isinstance(scene, lazyobj.LazyObjFileLoader):
+            # objects parsed later are timed with the others
+            scene.stats = self.stats
+        self._scene = scene
+        self._chunks = {}
+        self._bvhs = {}
+        self.scene_graph = SceneGraph(list(scene.objects))
+        self._moved = set()
+        self.progress = 1
         self.setup_canvas()
+        logger.info(
+            "ObjectRenderer: loaded scene %s, %s", self.scene, self.stats)
+        self.dispatch('on_load_complete', scene)
+
+    def on_load_start(self, source):
+        pass
+
+    def on_load_complete(self, scene):
+        pass
+
+    def on_load_error(self, error):
+        pass
+
+    def on_stats(self, stats):
+        pass
 
     def on_obj_id(self, *args):
-        self.setup_canvas()
+        self.update_visibility()
+
+    def update_visibility(self, *args):
+        """Show the object ``obj_id``, or all of them with ``display_all``,
+        and hide the others, their meshes stay uploaded. Shown objects get
+        the level of detail fitting their size on screen."""
+        if self._scene is None:
+            return
+
+        if self.display_all:
+            visible = list(self._scene.objects)
+        elif self.obj_id in self._scene.objects:
+            visible = [self.obj_id]
+        else:
+            visible = []
+        if self.hidden_objects:
+            hidden = set(self.hidden_objects)
+            visible = [obj_id for obj_id in visible if obj_id not in hidden]
+        if self.frustum_culling and self._projection is not None:
+            visible = self.cull(visible)
+        self._visible = visible
+
+        if self.batching and self.display_all:
+            batches = self.show_batches(visible)
+            batched = self._batched
+            singles = [
+                obj_id for obj_id in visible if obj_id not in batched]
+        else:
+            batches = []
+            singles = visible
+        objects = self.show_objects(singles)
+        instances = self.show_instances()
+        drawn = batches + objects
+        self._assign_lights(batches, singles, objects, instances)
+
+        groups = [d.group for d in drawn]
+        for copies in instances:
+            groups += copies.groups
+        if instances:
+            # objects drawn first next frame are not tinted
+            groups.append(self._untinted)
+        if groups != self._shown:
+            self._shown = groups
+            self.objects_group.clear()
+            for group in groups:
+                self.objects_group.add(group)
+        self.update_stats(visible, drawn + instances)
+
+    def show_objects(self, visible):
+        """Return the :class:`_DrawnObject` of the objects of ``visible``,
+        drawn with their own meshes."""
+        view = self.view_matrix()
+        drawn_objects = []
+        for obj_id in visible:
+            drawn = self._objects.get(obj_id)
+            if drawn is None:
+                drawn = self._objects[obj_id] = self.draw_object(obj_id)
+            self.set_level(obj_id, self.lod_level(obj_id, drawn.level, view))
+            drawn_objects.append(drawn)
+        return drawn_objects
+
+    def show_batches(self, visible):
+        """Return the :class:`_Batch` of :meth:`build_batches`, drawing
+        the objects of ``visible`` they merged."""
+        if self._batches is None:
+            self._batches = self.build_batches()
+            self._batched = set(
+                obj_id for batch in self._batches for obj_id in batch.obj_ids)
+        visible = set(visible)
+        for batch in self._batches:
+            batch.show(visible)
+        return list(self._batches)
+
+    def _assign_lights(self, batches, obj_ids, objects, instances):
+        """Give the :class:`_Batch` ``batches``, the
+        :class:`_DrawnObject` ``objects`` of ``obj_ids`` and the copies of
+        the :class:`_Instances` drawn the lights reaching their bounding
+        spheres, see :class:`lights.LightManager`."""
+        view = self.view_matrix()
+        if self._view_mat is None or (view != self._view_mat).any():
+            # lights are given in the coordinates of the scene, whatever
+            # the transforms of the objects
+            self._view_mat = view
+            self.fbo['view_mat'] = _kivy_matrix(view)
+        self.set_uniform('view_scale', float(self.obj_scale))
+
+        # lights only change with the lights or the placement of objects
+        placement = (self.lights.version, self._placements)
+        objects_of = self._scene.objects
+
+        def stale(target):
+            return target.lit is None or target.lit[0] != placement
+
+        def bounded(obj_ids):
+            return [
+                obj_id for obj_id in obj_ids
+                if getattr(objects_of[obj_id], 'aabb', None) is not None]
+
+        # _DrawnObject and _Copy lit, and the sphere around what they draw
+        targets = [batch.drawn for batch in batches] + list(objects)
+        lit = []
+        spheres = []
+        for batch in batches:
+            if stale(batch.drawn):
+                merged = bounded(batch.obj_ids)
+                lit.append(batch.drawn)
+                spheres.append(
+                    enclosing_sphere(self.bounds(merged)[1])
+                    if len(merged) == len(batch.obj_ids) else None)
+        singles = [
+            (obj_id, drawn) for obj_id, drawn in zip(obj_ids, objects)
+            if stale(drawn)]
+        around = {}
+        single_ids = bounded([obj_id for obj_id, drawn in singles])
+        if single_ids:
+            around = dict(zip(single_ids, self.bounds(single_ids)[1]))
+        for obj_id, drawn in singles:
+            lit.append(drawn)
+            spheres.append(around.get(obj_id))
+        for copies in instances:
+            shown = [copies.copies[i] for i in copies.shown]
+            targets += shown
+            shown = [i for i, copy in zip(copies.shown, shown) if stale(copy)]
+            if not shown:
+                continue
+            lit += [copies.copies[i] for i in shown]
+            if bounded([copies.obj_id]):
+                sphere = self.bounds([copies.obj_id])[1]
+                spheres += list(frustum.transform_spheres(
+                    copies.matrices[shown],
+                    np.tile(sphere, (len(shown), 1))))
+            else:
+                spheres += [None] * len(shown)
+
+        # targets with the same lights share their ChangeState
+        states = {}
+        for target, lights in zip(lit, self.lights.select(spheres)):
+            key = tuple(lights)
+            state = states.get(key)
+            if state is None:
+                state = states[key] = ChangeState(
+                    **self.lights.uniforms(lights))
+            if target.lit is not None:
+                target.group.remove(target.lit[1])
+            target.group.insert(0, state)
+            target.lit = placement, state, len(lights)
+        self.stats.counters['lights'] = sum(
+            target.lit[2] for target in targets)
+
+    def show_instances(self):
+        """Return the :class:`_Instances` of :meth:`add_instances` not in
+        hidden_objects, showing their copies in the view frustum."""
+        planes = None
+        if self.frustum_culling and self._projection is not None:
+            planes = frustum.frustum_planes(
+                self._projection.dot(self.view_matrix()))
+        hidden = set(self.hidden_objects)
+        shown = []
+        for name, instances in self._instances.items():
+            if name in hidden:
+                continue
+            box = sphere = None
+            if getattr(
+                    self._scene.objects[instances.obj_id], 'aabb',
+                    None) is not None:
+                boxes, spheres = self.bounds([instances.obj_id])
+                box, sphere = boxes[0], spheres[0]
+            instances.show(planes, box, sphere)
+            shown.append(instances)
+        return shown
+
+    def update_stats(self, visible, drawn):
+        """Count what is drawn in :attr:`stats`, ``visible`` being the
+        objects shown and ``drawn`` the :class:`_DrawnObject`,
+        :class:`_Batch` and :class:`_Instances` drawing them, and dispatch
+        on_stats."""
+        sizes = [d.size() for d in drawn]
+        counters = self.stats.counters
+        counters['objects'] = len(visible)
+        counters['draw_calls'] = sum(size[0] for size in sizes)
+        counters['vertices'] = sum(size[1] for size in sizes)
+        counters['indices'] = sum(size[2] for size in sizes)
+        counters['texture_bytes'] = sum(
+            self.texture_cache.texture_size(source)
+            for source in set(self._textures))
+        self.dispatch('on_stats', self.stats)
+
+    def build_batches(self):
+        """Return the :class:`_Batch` of each set of objects sharing their
+        texture, material and vertex format. Objects moved by the scene
+        graph keep their own meshes."""
+        objects = self._scene.objects
+        groups = {}
+        for obj_id, m in objects.items():
+            if obj_id in self._moved:
+                continue
+            key = (
+                m.texture, tuple(tuple(x) for x in m.vertex_format),
+                tuple(m.ambient_color), tuple(m.diffuse_color),
+                tuple(m.specular_color), m.specular_coefficent,
+                m.transparency, _ranges_key(m))
+            groups.setdefault(key, []).append(obj_id)
+
+        with self.stats.stage('buffers'):
+            batches = self._merge_groups(groups)
+        logger.info(
+            'ObjectRenderer: batched %s objects in %s meshes, %s before',
+            sum(len(b.obj_ids) for b in batches),
+            sum(len(b.parts) for b in batches),
+            self.draw_calls(batched=False))
+        return batches
+
+    def _merge_groups(self, groups):
+        objects = self._scene.objects
+        batches = []
+        for obj_ids in groups.values():
+            m = objects[obj_ids[0]]
+            stride = sum(x[1] for x in m.vertex_format)
+            obj_ids = [
+                obj_id for obj_id in obj_ids
+                if not len(objects[obj_id].vertices) % stride]
+            if not obj_ids:
+                continue
+            vertices, indices, owners = merge_meshes(
+                [(objects[obj_id].vertices, objects[obj_id].indices)
+                 for obj_id in obj_ids], stride)
+            triangles = indices.reshape(-1, 3)
+
+            drawn = self.draw_object(obj_ids[0])
+            parts = []
+            for part in split_triangles(
+                    vertices, triangles, m.vertex_format,
+                    ranges=getattr(m, 'quantization', None)):
+                first, local = first_unique(triangles[part].ravel())
+                used = triangles[part].ravel()[first]
+                local = local.astype('uint16')
+                mesh = Mesh(
+                    vertices=vertices[used].reshape(-1),
+                    indices=local,
+                    fmt=m.vertex_format,
+                    texture=drawn.texture,
+                    mode=self.mode)
+                drawn.mesh_group.add(mesh)
+                parts.append((mesh, local, owners[part]))
+            drawn.levels[0] = [mesh for mesh, indices, owners in parts]
+            drawn.level = 0
+            batches.append(_Batch(drawn, obj_ids, parts))
+        return batches
+
+    def draw_calls(self, batched=None):
+        """Return the number of meshes drawing all the objects, batched or
+        not, by default in the current mode. Without batching, it's the
+        least number of 16 bits meshes holding each object."""
+        if batched is None:
+            batched = self.batching and self.display_all
+        if batched:
+            if self._batches is None:
+                self._batches = self.build_batches()
+            return sum(len(batch.parts) for batch in self._batches)
+
+        calls = 0
+        for m in self._scene.objects.values():
+            count = len(m.vertices) // sum(x[1] for x in m.vertex_format)
+            calls += max(1, -(-count // MAX_VERTICES))
+        return calls
+
+    def lod_level(self, obj_id, current, view):
+        """Return the level of detail to draw object ``obj_id`` with, its
+        current level being ``current`` and ``view`` the matrix of
+        :meth:`view_matrix`: the coarsest whose error projected on screen
+        is below :attr:`lod_threshold`."""
+        m = self._scene.objects[obj_id]
+        lods = getattr(m, 'lods', None)
+        sphere = getattr(m, 'bounding_sphere', None)
+        if (not lods or not sphere or not self.lod_threshold or
+                self._projection is None):
+            return 0
+
+        (x, y, z), radius = sphere
+        scale = self.obj_scale
+        if obj_id in self._moved:
+            (x, y, z, moved_radius), = frustum.transform_spheres(
+                self.scene_graph.world([obj_id]), [[x, y, z, radius]])
+            if radius:
+                scale *= moved_radius / radius
+            radius = moved_radius
+        depth = -view.dot([x, y, z, 1])[2]
+        # nearest point of the object, not closer than the near plane
+        distance = max(depth - radius * self.obj_scale, 1)
+        pixels = scale * self._projection[1, 1] * self.height / 2. / distance
+        errors = [0] + [error * pixels for vertices, indices, error in lods]
+
+        def coarsest(limit):
+            return max(
+                level for level, error in enumerate(errors) if error <= limit)
+
+        limit = self.lod_threshold
+        hysteresis = self.lod_hysteresis
+        if current is None or errors[current] > limit * (1 + hysteresis):
+            return coarsest(limit)
+        return max(current, coarsest(limit * (1 - hysteresis)))
+
+    def set_level(self, obj_id, level, drawn=None):
+        """Draw object ``obj_id`` with level of detail ``level``, 0 being
+        the full resolution mesh, with its own instructions or ``drawn``."""
+        if drawn is None:
+            drawn = self._objects[obj_id]
+        if level == drawn.level:
+            return
+        if drawn.level is not None:
+            for mesh in drawn.levels[drawn.level]:
+                drawn.mesh_group.remove(mesh)
+
+        meshes = drawn.levels.get(level)
+        if meshes is None:
+            shared = self._meshes.get((obj_id, level))
+            if shared is None:
+                with self.stats.stage('buffers'):
+                    chunks = self.mesh_arguments(obj_id, level)
+                    meshes = [
+                        Mesh(texture=drawn.texture, mode=self.mode,
+                             **arguments)
+                        for arguments in chunks]
+                stride = sum(x[1] for x in chunks[0]['fmt']) if chunks else 1
+                shared = self._meshes[(obj_id, level)] = meshes, (
+                    len(meshes),
+                    sum(len(a['vertices']) for a in chunks) // stride,
+                    sum(len(a['indices']) for a in chunks))
+            meshes, drawn.sizes[level] = shared
+            drawn.levels[level] = meshes
+        for mesh in meshes:
+            drawn.mesh_group.add(mesh)
+        drawn.level = level
+
+    def view_matrix(self):
+        """Return the matrix of the transforms setup_scene applies to the
+        objects, as a numpy array."""
+        cam, obj = self.cam_rotation, self.obj_rotation
+        return reduce(np.dot, [
+            frustum.translation(self.cam_translation),
+            frustum.rotation(cam[0], 1, 0, 0),
+            frustum.rotation(cam[1], 0, 1, 0),
+            frustum.rotation(cam[2], 0, 0, 1),
+            frustum.scaling(self.obj_scale),
+            frustum.rotation(obj[0], 1, 0, 0),
+            frustum.rotation(obj[1], 0, 1, 0),
+            frustum.rotation(obj[2], 0, 0, 1),
+            frustum.translation(self.obj_translation)])
+
+    def cull(self, obj_ids):
+        """Return the objects of ``obj_ids`` in the view frustum, objects
+        without bounding volumes are kept."""
+        objects = self._scene.objects
+        bounded = [
+            obj_id for obj_id in obj_ids
+            if getattr(objects[obj_id], 'aabb', None) is not None]
+        if not bounded:
+            return obj_ids
+
+        planes = frustum.frustum_planes(
+            self._projection.dot(self.view_matrix()))
+        boxes, spheres = self.bounds(bounded)
+        inside = frustum.visible(planes, boxes, spheres)
+        culled = set(
+            obj_id for obj_id, keep in zip(bounded, inside) if not keep)
+        return [obj_id for obj_id in obj_ids if obj_id not in culled]
+
+    def add_node(self, name, parent=None):
+        """Add node ``name`` to the scene graph, under node ``parent``,
+        to move the objects put under it together."""
+        self.scene_graph.add([name], parent)
+
+    def set_node_parent(self, name, parent):
+        """Move node or object ``name`` under node ``parent``, or to the
+        roots if None, its transform becoming relative to the parent's."""
+        self.scene_graph.set_parent(name, parent)
+        self._trigger_transforms()
+
+    def move_node(self, name, translation=(0, 0, 0), rotation=(0, 0, 0),
+                  scale=1, matrix=None):
+        """Set the transform of node or object ``name`` relative to its
+        parent, to numpy ``matrix`` or else from ``translation``,
+        ``rotation`` and ``scale``, see :func:`scenegraph.trs`. Moves are
+        applied once per frame, only to the nodes under those changed."""
+        if matrix is None:
+            self.scene_graph.set_transform(name, translation, rotation, scale)
+        else:
+            self.scene_graph.set_matrix(name, matrix)
+        self._trigger_transforms()
+
+    def update_transforms(self, *args):
+        """Apply the changes of the scene graph to the instructions of the
+        objects."""
+        changed = self.scene_graph.update()
+        if not changed or self._scene is None:
+            return
+        objects = self._scene.objects
+        changed = [name for name in changed if name in objects]
+        self._placements += 1
+        identity = np.identity(4)
+        for name, matrix in zip(changed, self.scene_graph.world(changed)):
+            if (matrix == identity).all():
+                self._moved.discard(name)
+            else:
+                self._moved.add(name)
+            drawn_objects = [self._objects.get(name)] + [
+                instances.drawn for instances in self._instances.values()
+                if instances.obj_id == name]
+            for drawn in drawn_objects:
+                if drawn is not None and (
+                        drawn.transform is not None or name in self._moved):
+                    drawn.set_matrix(matrix)
+        if self._batched.intersection(changed):
+            # merged again without the moved objects
+            self._batches = None
+            self._batched = set()
+        self._trigger_culling()
+
+    def add_instances(self, name, obj_id, matrices, tints=None):
+        """Draw copies of object ``obj_id`` at full resolution, placed in
+        the scene by the (N, 4, 4) numpy ``matrices`` after the transform
+        of the object, their colors multiplied by the (N, 4) rgba
+        ``tints``, white by default. The copies share the meshes of the
+        object, its vertices are uploaded once however many there are;
+        ``name`` refers to them in :meth:`set_instances`,
+        :meth:`remove_instances` and hidden_objects."""
+        if name in self._instances:
+            raise ValueError('instances %s already exist' % name)
+        drawn = self.draw_object(obj_id)
+        # the meshes of the object, if it's drawn already
+        self.set_level(obj_id, 0, drawn)
+        instances = _Instances(obj_id, drawn)
+        instances.set(matrices, tints)
+        self._instances[name] = instances
+        self._trigger_culling()
+
+    def set_instances(self, name, matrices=None, tints=None):
+        """Change the ``matrices`` and ``tints`` of the copies ``name``,
+        the unchanged ones if None. Only the transforms and tints that
+        differ are updated, the meshes stay as they are."""
+        self._instances[name].set(matrices, tints)
+        if matrices is not None:
+            self._placements += 1
+        self._trigger_culling()
+
+    def remove_instances(self, name):
+        """Stop drawing the copies ``name``, releasing their texture."""
+        drawn = self._instances.pop(name).drawn
+        drawn.removed = True
+        if drawn.source is not None:
+            self._textures.remove(drawn.source)
+            self.texture_cache.release(drawn.source)
+        self._trigger_culling()
+
+    def bounds(self, obj_ids):
+        """Return the (N, 2, 3) boxes and (N, 4) spheres around objects
+        ``obj_ids``, which must have bounding volumes, as placed by the
+        scene graph."""
+        objects = self._scene.objects
+        boxes = np.array(
+            [objects[obj_id].aabb for obj_id in obj_ids], dtype='float64')
+        spheres = np.array(
+            [list(objects[obj_id].bounding_sphere[0]) +
+             [objects[obj_id].bounding_sphere[1]] for obj_id in obj_ids],
+            dtype='float64').reshape(-1, 4)
+        if self._moved:
+            matrices = self.scene_graph.world(obj_ids)
+            boxes = frustum.transform_boxes(matrices, boxes)
+            spheres = frustum.transform_spheres(matrices, spheres)
+        return boxes, spheres
+
+    def bvh(self, obj_id):
+        """Return the :class:`bvh.BVH` of the triangles of object
+        ``obj_id``, at full resolution."""
+        tree = self._bvhs.get(obj_id)
+        if tree is None:
+            m = self._scene.objects[obj_id]
+            vertices, vertex_format = m.vertices, m.vertex_format
+            if getattr(m, 'quantization', None) is not None:
+                vertices, vertex_format = dequantize(
+                    vertices, vertex_format, m.quantization)
+            stride = sum(x[1] for x in vertex_format)
+            offset = attribute_offset(vertex_format, 'v_pos')
+            positions = np.asarray(
+                vertices, dtype='float32').reshape(-1, stride)
+            tree = self._bvhs[obj_id] = BVH(
+                positions[:, offset:offset + 3], m.indices)
+        return tree
+
+    def pick(self, x, y):
+        """Return the (obj_id, triangle, point) of the object drawn at
+        ``x``, ``y``, in the coordinates of the parent like touches, or
+        None. ``triangle`` is the number of the triangle hit in the indices
+        of the object, ``point`` where, in the coordinates of its vertices.
+        """
+        if (self._scene is None or self._projection is None or
+                not self.collide_point(x, y)):
+            return None
+
+        # ray from the near to the far plane through the point
+        unproject = np.linalg.inv(self._projection.dot(self.view_matrix()))
+        ndc_x = 2. * (x - self.x) / self.width - 1
+        ndc_y = 2. * (y - self.y) / self.height - 1
+        near = unproject.dot([ndc_x, ndc_y, -1, 1])
+        far = unproject.dot([ndc_x, ndc_y, 1, 1])
+        origin = near[:3] / near[3]
+        direction = far[:3] / far[3] - origin
+
+        objects = self._scene.objects
+        bounded = [
+            obj_id for obj_id in self._visible
+            if getattr(objects[obj_id], 'aabb', None) is not None]
+        # objects without bounds are always tested
+        entries = [
+            (0, obj_id) for obj_id in set(self._visible) - set(bounded)]
+        if bounded:
+            enter, leave = ray_boxes(
+                origin, direction, self.bounds(bounded)[0])
+            entries += [
+                (distance, obj_id)
+                for distance, end, obj_id in zip(enter, leave, bounded)
+                if distance <= end and end >= 0]
+
+        best = None
+        # nearest boxes first, until one starts behind the nearest hit
+        for start, obj_id in sorted(entries, key=lambda e: e[0]):
+            if best is not None and start > best[2]:
+                break
+            ray = origin, direction
+            if obj_id in self._moved:
+                # the same ray in the coordinates of the vertices, where
+                # distances along it are the same
+                local = np.linalg.inv(self.scene_graph.world([obj_id])[0])
+                ray = (
+                    local[:3, :3].dot(origin) + local[:3, 3],
+                    local[:3, :3].dot(direction))
+            hit = self.bvh(obj_id).intersect(*ray)
+            if hit is not None and (best is None or hit[1] < best[2]):
+                best = (obj_id, ) + hit + (ray[0] + hit[1] * ray[1], )
+        if best is None:
+            return None
+        obj_id, triangle, distance, point = best
+        return obj_id, triangle, point.tolist()
 
     def on_size(self, instance, value):
         self.fbo.size = value
@@ -137,56 +1170,117 @@ class ObjectRenderer(Widget):
         asp = self.width / float(self.height)
         proj = Matrix().view_clip(-asp, asp, -1, 1, 1, 100, 1)
         self.fbo['projection_mat'] = proj
+        self._projection = frustum.from_kivy(proj)
+        self._trigger_culling()
 
     def setup_scene(self):
         Color(1, 1, 1, 0)
 
         PushMatrix()
-        self.cam_translate = Translate(self.cam_translation)
+        self.cam_translate = Translate(*self.cam_translation)
         # Rotate(0, 1, 0, 0)
         self.cam_rot_x = Rotate(self.cam_rotation[0], 1, 0, 0)
         self.cam_rot_y = Rotate(self.cam_rotation[1], 0, 1, 0)
         self.cam_rot_z = Rotate(self.cam_rotation[2], 0, 0, 1)
-        self.scale = Scale(self.obj_scale)
+        self.scale = Scale(*[self.obj_scale] * 3)
         UpdateNormalMatrix()
-        if self.display_all:
-            for i in self._scene.objects:
-                self.draw_object(i)
-        else:
-            self.draw_object(self.obj_id)
-        PopMatrix()
-
-    def draw_object(self, obj_id):
-        m = self._scene.objects[obj_id]
         self.obj_rot_x = Rotate(self.obj_rotation[0], 1, 0, 0)
         self.obj_rot_y = Rotate(self.obj_rotation[1], 0, 1, 0)
         self.obj_rot_z = Rotate(self.obj_rotation[2], 0, 0, 1)
-        self.obj_translate = Translate(xyz=self.obj_translation)
+        self.obj_translate = Translate(*self.obj_translation)
+        # filled by update_visibility with the groups of the shown objects
+        self.objects_group = InstructionGroup()
+        PopMatrix()
 
-        if len(m.indices) > 2 ** 16:
-            print '%s too big! %s indices' % (obj_id, len(m.indices))
+    def draw_object(self, obj_id):
+        """Return the retained instructions drawing object ``obj_id``, its
+        meshes are added by :meth:`set_level`."""
+        m = self._scene.objects[obj_id]
+        group = InstructionGroup()
 
+        texture = source = None
         if m.texture:
-            print "loading texture %s " % m.texture
-            img = Image(source=resource_find(
-                join(dirname(self.scene), m.texture)))
-            texture = img.texture
-            if texture:
-                texture.wrap = 'repeat'
-        else:
-            texture = None
-
-        vertex_lenght = sum(x[1] for x in m.vertex_format)
-        if len(m.vertices) % vertex_lenght:
-            print(
-                (
-                    'warning: vertices lenght (%s)'
-                    'is not a multiple of vertex_format lenght(%s)'
-                )
-                % (len(m.vertices), vertex_lenght))
-        Mesh(
-            vertices=m.vertices,
-            indices=m.indices,
-            fmt=m.vertex_format,
-            texture=texture,
-            mode=self.mode)
+            source = resource_find(join(dirname(self.scene), m.texture))
+            if not source:
+                logger.warning(
+                    "ObjectRenderer: texture %s not found", m.texture)
+            elif not self.async_textures:
+                texture = self.texture_cache.acquire(
+                    source, stats=self.stats)
+                if texture:
+                    self._textures.append(source)
+
+        # the material is given as uniforms, unless the vertex format
+        # carries it
+        per_vertex_material = any(
+            x[0] == 'v_ambient' for x in m.vertex_format)
+        # and how to unpack the attributes of compact formats
+        names = [x[0] for x in m.vertex_format]
+        ranges = getattr(m, 'quantization', None) or {}
+        group.add(ChangeState(
+            quantized=tuple(
+                float(name in names)
+                for name in ('v_pos_q', 'v_normal_q', 'v_tc0_q')),
+            per_vertex_material=float(per_vertex_material),
+            mat_ambient=tuple(float(x) for x in m.ambient_color),
+            mat_diffuse=tuple(float(x) for x in m.diffuse_color),
+            mat_specular=tuple(float(x) for x in m.specular_color),
+            mat_specular_coeff=float(m.specular_coefficent),
+            mat_transparency=float(m.transparency),
+            **dict((name, tuple(float(x) for x in value))
+                   for name, value in ranges.items())))
+
+        drawn = _DrawnObject(group, texture)
+        if texture:
+            drawn.source = source
+        if obj_id in self._moved:
+            drawn.set_matrix(self.scene_graph.world([obj_id])[0])
+        if source and self.async_textures:
+            self.texture_cache.acquire_async(source, partial(
+                self._set_texture, self._canvas_id, source, drawn),
+                stats=self.stats)
+        return drawn
+
+    def _set_texture(self, canvas_id, source, drawn, texture):
+        if texture is None:
+            return
+        if canvas_id != self._canvas_id or drawn.removed:
+            # the canvas was rebuilt, or the instructions removed, while the
+            # texture was decoded
+            self.texture_cache.release(source)
+            return
+        self._textures.append(source)
+        drawn.source = source
+        drawn.texture = texture
+        for mesh in drawn.meshes():
+            mesh.texture = texture
+
+    def mesh_arguments(self, obj_id, level=0):
+        """Return the arguments of the meshes drawing object ``obj_id`` at
+        level of detail ``level``, see :func:`meshtools.mesh_arguments`."""
+        chunks = self._chunks.get((obj_id, level))
+        if chunks is None:
+            m = self._scene.objects[obj_id]
+            if level:
+                vertices, indices, error = m.lods[level - 1]
+            else:
+                vertices, indices = m.vertices, m.indices
+
+            try:
+                chunks, duplicated = mesh_arguments(
+                    vertices, indices, m.vertex_format,
+                    getattr(m, 'quantization', None))
+            except ValueError as e:
+                logger.warning('ObjectRenderer: %s, %s', obj_id, e)
+                chunks = [dict(
+                    vertices=vertices,
+                    indices=np.asarray(indices, dtype='uint16'),
+                    fmt=m.vertex_format)]
+            else:
+                if len(chunks) > 1:
+                    logger.debug(
+                        'ObjectRenderer: %s split in %s meshes, %s vertices '
+                        'duplicated',
+                        obj_id, len(chunks), duplicated)
+            self._chunks[(obj_id, level)] = chunks
+        return chunks
@@ -1,22 +1,44 @@
+import logging
 import os
+import warnings
 from os.path import dirname, join
 
+import numpy as np
 
-class MeshData(object):
+from meshtools import (
+    MeshOperations, corner_normals, first_unique, weld_vertices)
+from stats import Stats
+
+logger = logging.getLogger(__name__)
+
+
+# attributes of the vertices, the material of a mesh is given to the
+# shader as uniforms
+VERTEX_FORMAT = [
+    ('v_pos', 3, 'float'),
+    ('v_normal', 3, 'float'),
+    ('v_tc0', 2, 'float'),
+    ]
+
+# former format, repeating the material in every vertex
+MATERIAL_VERTEX_FORMAT = VERTEX_FORMAT + [
+    ('v_ambient', 3, 'float'),
+    ('v_diffuse', 3, 'float'),
+    ('v_specular', 3, 'float'),
+    ('v_specular_coeff', 1, 'float'),
+    ('v_transparency', 1, 'float'),
+    ]
+
+
+class MeshData(MeshOperations):
     def __init__(self, **kwargs):
         self.name = kwargs.get("name")
-        self.vertex_format = [
-            ('v_pos', 3, 'float'),
-            ('v_normal', 3, 'float'),
-            ('v_tc0', 2, 'float'),
-            ('v_ambient', 3, 'float'),
-            ('v_diffuse', 3, 'float'),
-            ('v_specular', 3, 'float'),
-            ('v_specular_coeff', 1, 'float'),
-            ('v_transparency', 1, 'float'),
-            ]
-        self.vertices = []
-        self.indices = []
+        if kwargs.get("per_vertex_material"):
+            self.vertex_format = list(MATERIAL_VERTEX_FORMAT)
+        else:
+            self.vertex_format = list(VERTEX_FORMAT)
+        self.vertices = np.empty(0, dtype='float32')
+        self.indices = np.empty(0, dtype='uint32')
         # Default basic material of mesh object
         self.diffuse_color = (1.0, 1.0, 1.0)
         self.ambient_color = (1.0, 1.0, 1.0)
@@ -24,6 +46,14 @@ class MeshData(object):
         self.specular_coefficent = 16.0
         self.transparency = 1.0
         self.texture = None
+        # (low, high) corners of the box and (center, radius) of the sphere
+        # around the vertices, set by compute_bounds
+        self.aabb = None
+        self.bounding_sphere = None
+        # simplified (vertices, indices, error) versions, coarser last
+        self.lods = []
+        # ranges of the quantized attributes, set by quantize
+        self.quantization = None
 
     def set_materials(self, mtl_dict):
         self.diffuse_color = mtl_dict.get('Kd', self.diffuse_color)
@@ -40,32 +70,263 @@ class MeshData(object):
         self.transparency = float(transparency)
         self.texture = mtl_dict.get('map_Kd', self.texture)
 
-    def calculate_normals(self):
-        for i in range(len(self.indices) / (3)):
-            fi = i * 3
-            v1i = self.indices[fi]
-            v2i = self.indices[fi + 1]
-            v3i = self.indices[fi + 2]
 
-            vs = self.vertices
-            p1 = [vs[v1i + c] for c in range(3)]
-            p2 = [vs[v2i + c] for c in range(3)]
-            p3 = [vs[v3i + c] for c in range(3)]
+# kinds of lines told apart by _Chunk
+OTHER, VERTEX, NORMAL, TEXCOORD, FACE = range(5)
+
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[9, 10, 11, 12, 13, 32]] = True
+
+# size of the blocks read from OBJ files, they're cut at line boundaries
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _fromstring(text, dtype):
+    """Parse whitespace separated numbers, or return None if the text holds
+    anything else."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            return np.fromstring(text, dtype=dtype, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+
+
+def _read_chunks(f, size=CHUNK_SIZE):
+    """Yield the content of binary file ``f`` in blocks of whole lines."""
+    tail = b''
+    while True:
+        block = f.read(size)
+        if not block:
+            break
+        block = tail + block
+        cut = block.rfind(b'\n') + 1
+        tail = block[cut:]
+        if cut:
+            yield block[:cut]
+    if tail:
+        yield tail + b'\n'
+
+
+def _classify(buf):
+    """Return the (starts, ends, firsts, kinds) of the lines of ``buf``:
+    where they start and end, their first non blank character (the '\n'
+    of blank ones) and their kind among OTHER, VERTEX, NORMAL, TEXCOORD
+    and FACE."""
+    data = np.frombuffer(buf, dtype='uint8')
+    ends = np.flatnonzero(data == 10)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+
+    firsts = starts.copy()
+    indented = np.flatnonzero(_WHITESPACE[data[starts]])
+    if len(indented):
+        solid = np.append(np.flatnonzero(~_WHITESPACE[data]), len(data))
+        firsts[indented] = solid[np.searchsorted(solid, starts[indented])]
+    firsts = np.minimum(firsts, ends)
+    # past the end of the block reads its final '\n', as whitespace
+    c0 = data[firsts]
+    c1 = data.take(firsts + 1, mode='clip')
+    c2 = data.take(firsts + 2, mode='clip')
+
+    kinds = np.zeros(len(ends), dtype='uint8')
+    kinds[(c0 == ord('v')) & _WHITESPACE[c1]] = VERTEX
+    kinds[(c0 == ord('v')) & (c1 == ord('n')) & _WHITESPACE[c2]] = NORMAL
+    kinds[(c0 == ord('v')) & (c1 == ord('t')) & _WHITESPACE[c2]] = TEXCOORD
+    kinds[(c0 == ord('f')) & _WHITESPACE[c1]] = FACE
+    return starts, ends, firsts, kinds
+
+
+class _Chunk(object):
+    """Records of a block of OBJ lines, parsed with vectorized operations.
+
+    Only the structural statements (``o``, ``usemtl``, comments...) are left
+    as text in :attr:`statements`, as (line number, text) pairs; attribute
+    records are parsed into float arrays and faces into corner references.
+    """
+    def __init__(self, buf):
+        starts, ends, firsts, kinds = _classify(buf)
+
+        def select(kind, keyword):
+            """Return the text of the lines of ``kind``, with their keyword
+            blanked out, and the lines' boundaries."""
+            lines = np.flatnonzero(kinds == kind)
+            if not len(lines):
+                return b'', lines, lines
+            # join runs of consecutive lines, as they usually come in blocks
+            cuts = np.flatnonzero(np.diff(lines) != 1) + 1
+            runs = zip(starts[lines[np.r_[0, cuts]]],
+                       ends[lines[np.r_[cuts - 1, len(lines) - 1]]] + 1)
+            text = b''.join([buf[start:end] for start, end in runs])
+            text = text.replace(keyword, b' ' * len(keyword))
+            return text, firsts[lines] + len(keyword), ends[lines]
+
+        self.vertices = _parse_records(buf, 3, *select(VERTEX, b'v'))
+        self.normals = _parse_records(buf, 3, *select(NORMAL, b'vn'))
+        self.texcoords = _parse_records(buf, 2, *select(TEXCOORD, b'vt'))
+
+        self.face_lines = np.flatnonzero(kinds == FACE)
+        self.corners, self.counts = _parse_corners(buf, *select(FACE, b'f'))
+        # attributes defined in the chunk before each face, to resolve
+        # relative references
+        self.face_offsets = np.stack([
+            np.cumsum(kinds == kind)[self.face_lines]
+            for kind in (VERTEX, TEXCOORD, NORMAL)], axis=-1)
+
+        self.statements = [
+            (i, buf[firsts[i]:ends[i]].decode('utf-8', 'replace'))
+            for i in np.flatnonzero((kinds == OTHER) & (firsts < ends))]
+
+
+def _uniform_lines(text, width):
+    """Tell if every line of ``text``, holding ``width`` whitespace
+    separated tokens per line on average, holds exactly ``width``."""
+    data = np.frombuffer(text, dtype='uint8')
+    # np.fromstring accepted the text, so its only bytes up to the space
+    # are whitespace
+    solid = data > 32
+    tokens = np.flatnonzero(solid[1:] > solid[:-1]) + 1
+    if solid[:1].any():
+        tokens = np.r_[0, tokens]
+    lines = np.flatnonzero(data == 10)
+    if len(tokens) != len(lines) * width:
+        return False
+    # the first and last token of each line lie between its ends
+    tokens = tokens.reshape(-1, width)
+    return bool(
+        (tokens[:, -1] < lines).all() and (tokens[1:, 0] > lines[:-1]).all())
+
+
+def _parse_records(buf, width, text, starts, ends):
+    """Parse ``v``/``vn``/``vt`` records into a (len(starts), width) array,
+    ignoring extra components (such as ``w``) and zero-filling missing ones.
+    """
+    if not len(starts):
+        return np.zeros((0, width), dtype='float32')
+
+    data = _fromstring(text, 'float32')
+    if data is not None and not data.size % len(starts):
+        # the total alone can't tell mixed component counts apart
+        w = data.size // len(starts)
+        if w >= width and _uniform_lines(text, w):
+            return data.reshape(-1, w)[:, :width]
+
+    records = np.zeros((len(starts), width), dtype='float32')
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        values = buf[start:end].split()[:width]
+        records[i, :len(values)] = [float(v) for v in values]
+    return records
+
+
+def _parse_corners(buf, text, starts, ends):
+    """Parse ``f`` records into a (corners, 3) array of 1-based position,
+    texcoord and normal references (0 when absent), and the number of
+    corners of each face.
+    """
+    if not len(starts):
+        return np.zeros((0, 3), dtype='int64'), np.zeros(0, dtype='int64')
+
+    # the layout of the first corner must match the layout of all others
+    first = buf[starts[0]:ends[0]].split()[0]
+    if b'//' in first:
+        layout = (0, 2)
+    else:
+        layout = (0, 1, 2)[:first.count(b'/') + 1]
+    slash = np.frombuffer(text, dtype='uint8') == ord('/')
+    slashes = (np.count_nonzero(slash),
+               np.count_nonzero(slash[1:] & slash[:-1]))
+    refs = _fromstring(text.replace(b'/', b' '), 'int64')
+
+    def consistent(nb_corners):
+        return (refs is not None and
+                refs.size == nb_corners * len(layout) and
+                slashes[0] == nb_corners * first.count(b'/') and
+                slashes[1] == nb_corners * first.count(b'//'))
+
+    if consistent(3 * len(starts)):
+        counts = np.full(len(starts), 3, dtype='int64')
+    else:
+        whitespace = _WHITESPACE[np.frombuffer(buf, dtype='uint8')]
+        tokens = np.flatnonzero(~whitespace[1:] & whitespace[:-1]) + 1
+        counts = (np.searchsorted(tokens, ends) -
+                  np.searchsorted(tokens, starts))
+        if not consistent(counts.sum()):
+            # mixed corner layouts, parse them one by one
+            corners = np.zeros((counts.sum(), 3), dtype='int64')
+            tokens = b' '.join(
+                buf[start:end] for start, end in zip(starts, ends)).split()
+            for i, token in enumerate(tokens):
+                for j, ref in enumerate(token.split(b'/')[:3]):
+                    if ref:
+                        corners[i, j] = int(ref)
+            return corners, counts
+
+    if len(layout) == 3:
+        return refs.reshape(-1, 3), counts
+    corners = np.zeros((len(refs) // len(layout), 3), dtype='int64')
+    corners[:, layout] = refs.reshape(-1, len(layout))
+    return corners, counts
+
+
+def _triangulate(counts):
+    """Return the corner indices of the fan triangulation of faces having
+    ``counts`` corners each, as a (triangles, 3) array.
+    """
+    counts = np.maximum(counts, 2)
+    starts = np.cumsum(counts) - counts
+    ntris = counts - 2
+    first = np.repeat(starts, ntris)
+    offsets = np.arange(ntris.sum()) - np.repeat(np.cumsum(ntris) - ntris,
+                                                 ntris)
+    tris = np.empty((len(first), 3), dtype='int64')
+    tris[:, 0] = first
+    tris[:, 1] = first + offsets + 1
+    tris[:, 2] = first + offsets + 2
+    return tris
+
+
+class _AttributePool(object):
+    """Growable float32 array of ``v``, ``vn`` or ``vt`` records.
+
+    Row 0 is a zero sentinel, so the 1-based references of OBJ faces index
+    the array directly and a missing reference (0) reads zeros.
+
+    The first ``skipped`` records can be left as zeros, to :meth:`put` only
+    those needed later, ``capacity`` is the number of rows allocated.
+    """
+    def __init__(self, width, swapyz=False, skipped=0, capacity=1024):
+        self.width = width
+        self.swapyz = swapyz
+        self._data = np.zeros(
+            (max(capacity, skipped + 1), width), dtype='float32')
+        self._size = skipped + 1
+
+    def __len__(self):
+        return self._size - 1
 
-            u, v = [0, 0, 0], [0, 0, 0]
-            for j in range(3):
-                v[j] = p2[j] - p1[j]
-                u[j] = p3[j] - p1[j]
+    def extend(self, records):
+        if self.swapyz:
+            records = records[:, [0, 2, 1]]
 
-            n = [0, 0, 0]
-            n[0] = u[1] * v[2] - u[2] * v[1]
-            n[1] = u[2] * v[0] - u[0] * v[2]
-            n[2] = u[0] * v[1] - u[1] * v[0]
+        size = self._size + len(records)
+        if size > len(self._data):
+            data = np.zeros((max(size, 2 * len(self._data)), self.width),
+                            dtype='float32')
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:size] = records
+        self._size = size
 
-            # for k in range(3):
-            #     self.vertices[v1i + 3] = n[k]
-            #     self.vertices[v2i + 3] = n[k]
-            #     self.vertices[v3i + 3] = n[k]
+    def put(self, start, records):
+        """Set the records from the ``start``-th one, 0-based."""
+        if self.swapyz:
+            records = records[:, [0, 2, 1]]
+        self._data[start + 1:start + 1 + len(records)] = records
+
+    @property
+    def array(self):
+        return self._data[:self._size]
 
 
 class ObjFileLoader(object):
@@ -74,110 +335,270 @@ class ObjFileLoader(object):
         if self._current_object is None:
             return
 
-        mesh = MeshData()
-        idx = 0
+        with self.stats.stage('buffers'):
+            self._finish_object()
+        self.faces = []
+
+    def _finish_object(self):
+        mesh = MeshData(per_vertex_material=self.per_vertex_material)
         material = self.mtl.get(self.obj_material)
         if material:
             mesh.set_materials(material)
-        for f in self.faces:
-            verts = f[0]
-            norms = f[1]
-            tcs = f[2]
-            for i in range(3):
-                # get normal components
-                n = (0.0, 0.0, 0.0)
-                if norms[i] != -1:
-                    n = self.normals[norms[i]-1]
-
-                # get texture coordinate components
-                t = (0.0, 0.0)
-                if tcs[i] != -1:
-                    t = self.texcoords[tcs[i]-1]
-
-                # get vertex components
-                v = self.vertices[verts[i]-1]
-
-                data = [v[0], v[1], v[2], n[0], n[1], n[2], t[0], t[1]]
-                mesh.vertices.extend(data)
-
-                # add material info in the vertice
-                mesh.vertices.extend(list(
-                    mesh.ambient_color +
-                    mesh.diffuse_color +
-                    mesh.specular_color) +
-                    [mesh.specular_coefficent, mesh.transparency]
-                )
-
-            tri = [idx, idx+1, idx+2]
-            mesh.indices.extend(tri)
-            idx += 3
-
-        self.objects[self._current_object] = mesh
-        # mesh.calculate_normals()
-        self.faces = []
 
-    def __init__(self, filename, swapyz=False, delimiter="# object"):
-        """Loads a Wavefront OBJ file. """
+        normals = self.normals.array
+        if self.faces:
+            corners = np.concatenate([c for c, n, g in self.faces])
+            counts = np.concatenate([n for c, n, g in self.faces])
+            groups = np.concatenate([
+                np.full(len(n), g, dtype='int64') for c, n, g in self.faces])
+            if (counts == 3).all():
+                # triangles only, there's nothing to fan nor copy
+                corners = corners.reshape(-1, 3, 3)
+            else:
+                corners = corners[_triangulate(counts)]
+                groups = groups[np.repeat(
+                    np.arange(len(counts)), np.maximum(counts, 2) - 2)]
+
+            missing = corners[..., 2] == 0
+            if self.generate_normals and missing.any():
+                # generated normals are appended to the ones of the file
+                generated = corner_normals(
+                    self.vertices.array, corners[..., 0], groups,
+                    self.crease_angle, self.normal_weighting)[missing]
+                first, ids = first_unique(np.ascontiguousarray(
+                    generated).view(np.dtype((np.void, 12))).ravel())
+                corners[..., 2][missing] = len(normals) + ids
+                normals = np.concatenate([normals, generated[first]])
+            corners = corners.reshape(-1, 3)
+        else:
+            corners = np.zeros((0, 3), dtype='int64')
+
+        indices = np.arange(len(corners), dtype='uint32')
+        if self.weld:
+            # corners using the same records share a vertex, then vertices
+            # equal in value are merged
+            try:
+                keys = np.ravel_multi_index(corners.T, (
+                    len(self.vertices) + 1,
+                    len(self.texcoords) + 1,
+                    len(normals)))
+            except ValueError:
+                keys = np.ascontiguousarray(corners).view(
+                    np.dtype((np.void, 24))).ravel()
+            first, indices = first_unique(keys)
+            corners = corners[first]
+
+        stride = sum(size for name, size, kind in mesh.vertex_format)
+        v, t, n = np.ascontiguousarray(corners.T)
+        vertices = np.empty((len(corners), stride), dtype='float32')
+        vertices[:, 0:3] = self.vertices.array.take(v, axis=0)
+        vertices[:, 3:6] = normals.take(n, axis=0)
+        vertices[:, 6:8] = self.texcoords.array.take(t, axis=0)
+        if self.per_vertex_material:
+            # add material info in the vertices
+            vertices[:, 8:19] = (
+                list(mesh.ambient_color) +
+                list(mesh.diffuse_color) +
+                list(mesh.specular_color) +
+                [mesh.specular_coefficent, mesh.transparency])
+
+        if self.weld:
+            mesh.vertices, mesh.indices = weld_vertices(
+                vertices, indices, stride)
+            logger.debug(
+                "ObjFileLoader: welded %s, %d -> %d vertices",
+                self._current_object, len(indices),
+                len(mesh.vertices) // stride)
+        else:
+            mesh.vertices = vertices.reshape(-1)
+            mesh.indices = indices
+        mesh.compute_bounds()
+        if self.lod_ratios:
+            mesh.build_lods(self.lod_ratios)
+        if self.optimize_indices:
+            # the cache is simulated for the log only
+            measured = mesh.optimize_indices(
+                measure=logger.isEnabledFor(logging.DEBUG))
+            if measured:
+                logger.debug(
+                    "ObjFileLoader: optimized %s indices, acmr %.3f -> %.3f",
+                    self._current_object, *measured)
+        if self.quantize:
+            report = mesh.quantize(self.quantize)
+            logger.debug(
+                "ObjFileLoader: quantized %s, %d -> %d bytes, errors %s",
+                self._current_object, report['bytes'],
+                report['packed_bytes'], report['errors'])
+
+        self._finished.append((self._current_object, mesh))
+
+    def parse_chunk(self, chunk):
+        """Add the records of a :class:`_Chunk` to the attribute pools and
+        the current object, finishing objects as their end is reached.
+        """
+        # relative references count back from the records read so far
+        sizes = np.array([
+            len(self.vertices), len(self.texcoords), len(self.normals)])
+        corners = chunk.corners
+        if (corners < 0).any():
+            offsets = np.repeat(chunk.face_offsets, chunk.counts, axis=0)
+            corners = np.where(
+                corners < 0, corners + sizes + offsets + 1, corners)
+
+        self.vertices.extend(chunk.vertices)
+        self.normals.extend(chunk.normals)
+        self.texcoords.extend(chunk.texcoords)
+
+        ends = np.cumsum(chunk.counts)
+        face = 0
+        for lineno, line in chunk.statements + [(None, None)]:
+            if line is None:
+                last = len(chunk.counts)
+            else:
+                last = np.searchsorted(chunk.face_lines, lineno)
+            if last > face:
+                self.faces.append((
+                    corners[ends[face] - chunk.counts[face]:ends[last - 1]],
+                    chunk.counts[face:last],
+                    self.smoothing_group))
+                face = last
+            if line is not None:
+                self.parse_statement(line)
+
+    def parse_statement(self, line):
+        """Handle a line which isn't an attribute or face record."""
+        if self.delimiter == "# object" and "# object" in line:
+            if self._current_object:
+                self.finish_object()
+            self._current_object = line.split()[2]
+        if line.startswith('#'):
+            return
+        if line.startswith('s'):
+            values = line.split()
+            if values[0] == 's':
+                try:
+                    self.smoothing_group = int(values[1])
+                except (IndexError, ValueError):
+                    # "s off"
+                    self.smoothing_group = 0
+            return
+        values = line.split()
+        if values[0] == 'o':
+            self.finish_object()
+            self._current_object = values[1]
+        elif values[0] == 'mtllib':
+            # load materials file here
+            with self.stats.stage('material'):
+                self.mtl = MTL(join(dirname(self.filename), (values[1])))
+        elif values[0] in ('usemtl', 'usemat'):
+            self.obj_material = values[1]
+
+    def __init__(self, filename, swapyz=False, delimiter="# object",
+                 weld=True, per_vertex_material=False, generate_normals=True,
+                 crease_angle=None, normal_weighting='area', lod_ratios=(),
+                 optimize_indices=False, quantize=(), progress=None,
+                 stream=False, stats=None):
+        """Loads a Wavefront OBJ file.
+
+        With ``weld``, corners sharing the same position, normal, texcoord
+        (and material) use the same vertex, instead of every triangle
+        having its own three vertices.
+
+        With ``per_vertex_material``, meshes use the former
+        MATERIAL_VERTEX_FORMAT, repeating their material in every vertex.
+
+        With ``generate_normals``, faces without normals get smooth normals
+        within their smoothing group ("s" statements, faces before any of
+        them being smooth), weighted by ``normal_weighting`` ('area' or
+        'angle') and split along edges sharper than ``crease_angle``, see
+        :func:`meshtools.corner_normals`.
+
+        With ``lod_ratios``, meshes get simplified versions keeping about
+        each ratio of their vertices, see :meth:`MeshData.build_lods`.
+
+        With ``optimize_indices``, the triangles and vertices of meshes
+        are reordered for the vertex caches of the GPU, see
+        :meth:`MeshData.optimize_indices`.
+
+        With ``quantize``, attributes among quantization.QUANTIZABLE,
+        meshes get a compact vertex format packing them, see
+        :meth:`MeshData.quantize`.
+
+        ``progress`` is called with the fraction of the file read after
+        each block, it may raise to abort the loading.
+
+        With ``stream``, the file isn't parsed and :attr:`objects` stays
+        empty, :meth:`iter_objects` gives the objects one by one instead.
+
+        :attr:`stats`, a new :class:`stats.Stats` unless given, receives
+        the time spent parsing records ('parse'), reading materials
+        ('material') and building the buffers of the objects ('buffers').
+        """
+        self.filename = filename
+        self.weld = weld
+        self.per_vertex_material = per_vertex_material
+        self.generate_normals = generate_normals
+        self.crease_angle = crease_angle
+        self.normal_weighting = normal_weighting
+        self.lod_ratios = lod_ratios
+        self.optimize_indices = optimize_indices
+        self.quantize = quantize
+        self.stats = stats if stats is not None else Stats()
+        self.delimiter = delimiter
         self.objects = {}
-        self.vertices = []
-        self.normals = []
-        self.texcoords = []
+        self.vertices = _AttributePool(3, swapyz)
+        self.normals = _AttributePool(3, swapyz)
+        self.texcoords = _AttributePool(2)
+        # (corners, corner counts, smoothing group) of the faces of the
+        # current object
         self.faces = []
+        self.smoothing_group = 1
+        self.mtl = {}
 
         self._current_object = None
 
         self.obj_material = None
+        # objects finished in the last block, not yielded yet
+        self._finished = []
 
-        print "filename %s" % filename
-        for line in open(filename, "r"):
-            if delimiter == "# object" and "# object" in line:
-                if self._current_object:
-                    self.finish_object()
-                self._current_object = line.split()[2]
-            if line.startswith('#'):
-                continue
-            if line.startswith('s'):
-                continue
-            values = line.split()
-            if not values:
-                continue
-            if values[0] == 'o':
-                self.finish_object()
-                self._current_object = values[1]
-            elif values[0] == 'mtllib':
-                # load materials file here
-                self.mtl = MTL(join(dirname(filename), (values[1])))
-            elif values[0] in ('usemtl', 'usemat'):
-                self.obj_material = values[1]
-            if values[0] == 'v':
-                v = map(float, values[1:4])
-                if swapyz:
-                    v = v[0], v[2], v[1]
-                self.vertices.append(v)
-            elif values[0] == 'vn':
-                v = map(float, values[1:4])
-                if swapyz:
-                    v = v[0], v[2], v[1]
-                self.normals.append(v)
-            elif values[0] == 'vt':
-                self.texcoords.append(map(float, values[1:3]))
-            elif values[0] == 'f':
-                face = []
-                texcoords = []
-                norms = []
-                for v in values[1:]:
-                    w = v.split('/')
-                    face.append(int(w[0]))
-                    if len(w) >= 2 and len(w[1]) > 0:
-                        texcoords.append(int(w[1]))
-                    else:
-                        texcoords.append(-1)
-                    if len(w) >= 3 and len(w[2]) > 0:
-                        norms.append(int(w[2]))
-                    else:
-                        norms.append(-1)
-                self.faces.append((face, norms, texcoords))
+        if not stream:
+            for name, mesh in self.iter_objects(progress):
+                self.objects[name] = mesh
+
+    def iter_objects(self, progress=None):
+        """Parse the file, yielding the (name, MeshData) of each object as
+        soon as its end is read.
+
+        Only the attribute records of the file and the faces of the
+        object being read are kept meanwhile, so memory doesn't grow with
+        the objects already yielded.
+        """
+        logger.debug("ObjFileLoader: filename %s", self.filename)
+        size = os.path.getsize(self.filename)
+        done = 0
+        with open(self.filename, "rb") as f:
+            for block in _read_chunks(f):
+                with self.stats.stage('parse'):
+                    self.parse_chunk(_Chunk(block))
+                done += len(block)
+                if progress:
+                    progress(done / float(size or 1))
+                finished, self._finished = self._finished, []
+                for item in finished:
+                    yield item
         self.finish_object()
+        finished, self._finished = self._finished, []
+        for item in finished:
+            yield item
+
+
+def iter_objects(filename, progress=None, **options):
+    """Yield the (name, MeshData) of the objects of OBJ file ``filename``
+    one by one, as the file is read, see :meth:`ObjFileLoader.iter_objects`.
+    ``options`` are those of :class:`ObjFileLoader`.
+    """
+    loader = ObjFileLoader(filename, stream=True, **options)
+    return loader.iter_objects(progress)
 
 
 class MTL(object):
@@ -0,0 +1,150 @@
+'''Parallel loading of Wavefront OBJ files.
+
+The file is cut at line boundaries into byte ranges, parsed by worker
+processes which give back the arrays of their records as .npy files in
+shared memory. The main process maps them and merges the ranges in order,
+resolving relative references against the records read so far, and builds
+the objects exactly like :class:`objloader.ObjFileLoader`.
+
+Run as a script to compare the loading time with different numbers of
+workers::
+
+    python parallelobj.py model.obj 1 2 4 8
+'''
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool, cpu_count
+from os.path import isdir, join
+
+import numpy as np
+
+from objloader import CHUNK_SIZE, ObjFileLoader, _Chunk
+
+logger = logging.getLogger(__name__)
+
+# arrays of a parsed range sent back to the main process
+_ARRAYS = (
+    'vertices', 'normals', 'texcoords', 'corners', 'counts', 'face_offsets',
+    'face_lines')
+
+# ranges are smaller than CHUNK_SIZE when needed to give every worker a few
+MIN_RANGE_SIZE = 256 * 1024
+
+
+def split_ranges(filename, size):
+    """Return the (start, end) byte ranges of about ``size`` bytes covering
+    ``filename``, cut at line boundaries."""
+    total = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        while bounds[-1] + size < total:
+            f.seek(bounds[-1] + size)
+            f.readline()
+            bounds.append(min(f.tell(), total))
+    if bounds[-1] < total:
+        bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_range(args):
+    filename, start, end, directory = args
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        block = f.read(end - start)
+    if not block.endswith(b'\n'):
+        block += b'\n'
+    chunk = _Chunk(block)
+
+    path = tempfile.mkdtemp(dir=directory)
+    for name in _ARRAYS:
+        np.save(join(path, name + '.npy'), getattr(chunk, name))
+    return path, chunk.statements
+
+
+class _SharedChunk(object):
+    """Records of a range parsed by a worker, mapped from the files it
+    wrote, with the attributes of :class:`objloader._Chunk`."""
+    def __init__(self, path, statements):
+        for name in _ARRAYS:
+            setattr(self, name, np.load(
+                join(path, name + '.npy'), mmap_mode='r'))
+        self.statements = statements
+
+
+class ParallelObjFileLoader(ObjFileLoader):
+    """:class:`objloader.ObjFileLoader` parsing the file with ``workers``
+    processes, all the cores by default, other options are the same.
+    """
+    def __init__(self, filename, workers=None, **options):
+        self.workers = workers or cpu_count()
+        super(ParallelObjFileLoader, self).__init__(filename, **options)
+
+    def iter_objects(self, progress=None):
+        if self.workers < 2:
+            for item in super(ParallelObjFileLoader, self).iter_objects(
+                    progress):
+                yield item
+            return
+
+        logger.debug("ParallelObjFileLoader: filename %s", self.filename)
+        size = os.path.getsize(self.filename)
+        ranges = split_ranges(self.filename, min(CHUNK_SIZE, max(
+            MIN_RANGE_SIZE, size // (4 * self.workers) + 1)))
+        # shared memory when available, arrays never hit the disk there
+        directory = tempfile.mkdtemp(
+            prefix='objloader', dir='/dev/shm' if isdir('/dev/shm') else None)
+        pool = Pool(self.workers)
+        try:
+            tasks = [
+                (self.filename, start, end, directory)
+                for start, end in ranges]
+            results = pool.imap(_parse_range, tasks)
+            for start, end in ranges:
+                # waiting for the workers is part of the parsing
+                with self.stats.stage('parse'):
+                    path, statements = next(results)
+                    self.parse_chunk(_SharedChunk(path, statements))
+                # faces of the current object keep their mapping open
+                shutil.rmtree(path, ignore_errors=True)
+                if progress:
+                    progress(end / float(size or 1))
+                finished, self._finished = self._finished, []
+                for item in finished:
+                    yield item
+        finally:
+            pool.terminate()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.finish_object()
+        finished, self._finished = self._finished, []
+        for item in finished:
+            yield item
+
+
+def _same_objects(a, b):
+    return list(a) == list(b) and all(
+        np.array_equal(a[k].vertices, b[k].vertices) and
+        np.array_equal(a[k].indices, b[k].indices) for k in a)
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1]
+    counts = [int(x) for x in sys.argv[2:]] or [1, 2, 4, cpu_count()]
+
+    start = time.time()
+    reference = ObjFileLoader(filename).objects
+    serial = time.time() - start
+    print('serial: %.2fs' % serial)
+
+    for workers in counts:
+        start = time.time()
+        objects = ParallelObjFileLoader(filename, workers=workers).objects
+        duration = time.time() - start
+        print('%d workers: %.2fs, speedup %.2f, %s' % (
+            workers, duration, serial / duration,
+            'same objects' if _same_objects(reference, objects)
+            else 'DIFFERENT OBJECTS'))
@@ -0,0 +1,228 @@
+'''Compact vertex formats, quantizing the attributes of the vertices.
+
+Kivy only has float attributes, quantized values are packed in floats,
+which hold integers of up to 24 bits exactly, and unpacked by simple.glsl:
+
+- positions, 3 x 16 bits across the bounding box of the mesh, in 2 floats
+- normals, 2 x 12 bits of their octahedral encoding, in 1 float
+- texture coordinates, 2 x 12 bits across their range, in 1 float
+
+which turns the 8 floats of VERTEX_FORMAT into 4. The ranges the values
+are quantized across are given to the shader as uniforms.
+'''
+import numpy as np
+
+from meshtools import attribute_offset
+
+# attribute replacing each quantizable one, and its size
+PACKED_ATTRIBUTES = {
+    'v_pos': ('v_pos_q', 2),
+    'v_normal': ('v_normal_q', 1),
+    'v_tc0': ('v_tc0_q', 1),
+    }
+# and the other way around
+UNPACKED_ATTRIBUTES = {
+    'v_pos_q': ('v_pos', 3),
+    'v_normal_q': ('v_normal', 3),
+    'v_tc0_q': ('v_tc0', 2),
+    }
+QUANTIZABLE = ('v_pos', 'v_normal', 'v_tc0')
+
+POSITION_BITS = 16
+PACKED_BITS = 12
+
+
+def packed_format(vertex_format, attributes=QUANTIZABLE):
+    """Return ``vertex_format`` with ``attributes`` replaced by their
+    packed version."""
+    return [
+        (PACKED_ATTRIBUTES[name][0], PACKED_ATTRIBUTES[name][1], kind)
+        if name in attributes and name in PACKED_ATTRIBUTES
+        else (name, size, kind)
+        for name, size, kind in vertex_format]
+
+
+def unpacked_format(vertex_format):
+    """Return the vertex format ``vertex_format`` was packed from."""
+    return [
+        UNPACKED_ATTRIBUTES[name] + (kind, )
+        if name in UNPACKED_ATTRIBUTES else (name, size, kind)
+        for name, size, kind in vertex_format]
+
+
+def _pack(high, low, bits):
+    return high * float(1 << bits) + low
+
+
+def _unpack(packed, bits):
+    high = np.floor(packed / float(1 << bits))
+    return high, packed - high * (1 << bits)
+
+
+def _sign(values):
+    # 1 for zeros too, so they don't cancel the folding
+    return np.where(values >= 0, 1., -1.)
+
+
+def encode_octahedral(normals, bits=PACKED_BITS):
+    """Return the (N, 2) integers of ``bits`` bits encoding the directions
+    of the (N, 3) ``normals`` on an octahedron unfolded in a square."""
+    normals = np.asarray(normals, dtype='float64').reshape(-1, 3)
+    length = np.abs(normals).sum(axis=1)
+    # zero normals encode as +z
+    normals = np.where(
+        length[:, None] > 0, normals / np.maximum(length, 1e-30)[:, None],
+        [0., 0., 1.])
+    xy = normals[:, :2]
+    folded = (1 - np.abs(xy[:, ::-1])) * _sign(xy)
+    xy = np.where(normals[:, 2:] < 0, folded, xy)
+    top = (1 << bits) - 1
+    return np.round((xy + 1) / 2 * top)
+
+
+def decode_octahedral(encoded, bits=PACKED_BITS):
+    """Return the (N, 3) unit normals of :func:`encode_octahedral`."""
+    top = (1 << bits) - 1
+    xy = np.asarray(encoded, dtype='float64').reshape(-1, 2) / top * 2 - 1
+    z = 1 - np.abs(xy).sum(axis=1)
+    folded = (1 - np.abs(xy[:, ::-1])) * _sign(xy)
+    xy = np.where(z[:, None] < 0, folded, xy)
+    normals = np.concatenate([xy, z[:, None]], axis=1)
+    return normals / np.sqrt((normals ** 2).sum(axis=1))[:, None]
+
+
+def _span(values, bits):
+    low = values.min(axis=0) if len(values) else np.zeros(values.shape[1])
+    high = values.max(axis=0) if len(values) else low
+    # flat ranges still get a step, all their values being 0
+    scale = np.maximum(high - low, 1e-12) / ((1 << bits) - 1)
+    return low.tolist(), scale.tolist()
+
+
+def quantization_ranges(vertices, vertex_format, attributes=QUANTIZABLE):
+    """Return the ranges :func:`quantize` packs ``attributes`` of
+    ``vertices`` across, as the values of the pos_offset, pos_scale,
+    tc_offset and tc_scale uniforms of the shader."""
+    stride = sum(x[1] for x in vertex_format)
+    rows = np.asarray(vertices, dtype='float64').reshape(-1, stride)
+    ranges = {}
+    pos = attribute_offset(vertex_format, 'v_pos')
+    if 'v_pos' in attributes and pos is not None:
+        ranges['pos_offset'], ranges['pos_scale'] = _span(
+            rows[:, pos:pos + 3], POSITION_BITS)
+    tc = attribute_offset(vertex_format, 'v_tc0')
+    if 'v_tc0' in attributes and tc is not None:
+        ranges['tc_offset'], ranges['tc_scale'] = _span(
+            rows[:, tc:tc + 2], PACKED_BITS)
+    return ranges
+
+
+def quantize(vertices, vertex_format, attributes=QUANTIZABLE, ranges=None):
+    """Return the (vertices, vertex_format, ranges) of ``vertices`` with
+    ``attributes`` packed, across ``ranges`` or those of
+    :func:`quantization_ranges`.
+
+    Values outside given ``ranges`` are clamped to them, levels of detail
+    can use the ranges of their full resolution mesh.
+    """
+    stride = sum(x[1] for x in vertex_format)
+    rows = np.asarray(vertices, dtype='float64').reshape(-1, stride)
+    if ranges is None:
+        ranges = quantization_ranges(vertices, vertex_format, attributes)
+    packed_fmt = packed_format(vertex_format, attributes)
+
+    def scaled(values, offset, scale, bits):
+        steps = np.round((values - offset) / np.asarray(scale))
+        return np.clip(steps, 0, (1 << bits) - 1)
+
+    columns = []
+    offset = 0
+    for name, size, kind in vertex_format:
+        values = rows[:, offset:offset + size]
+        offset += size
+        if name not in attributes or name not in PACKED_ATTRIBUTES:
+            columns.append(values)
+        elif name == 'v_pos':
+            x, y, z = scaled(
+                values, ranges['pos_offset'], ranges['pos_scale'],
+                POSITION_BITS).T
+            # x and the 8 high bits of y, the 8 low ones and z
+            high, low = _unpack(y, 8)
+            columns.append(np.stack([
+                _pack(x, high, 8), _pack(low, z, POSITION_BITS)], axis=1))
+        elif name == 'v_normal':
+            u, v = encode_octahedral(values).T
+            columns.append(_pack(u, v, PACKED_BITS)[:, None])
+        else:
+            u, v = scaled(
+                values, ranges['tc_offset'], ranges['tc_scale'],
+                PACKED_BITS).T
+            columns.append(_pack(u, v, PACKED_BITS)[:, None])
+
+    packed = np.concatenate(
+        columns or [np.zeros((len(rows), 0))], axis=1).astype('float32')
+    return packed.reshape(-1), packed_fmt, ranges
+
+
+def dequantize(vertices, vertex_format, ranges):
+    """Return the (vertices, vertex_format) of :func:`quantize`'d
+    ``vertices`` unpacked to floats, as the shader decodes them."""
+    stride = sum(x[1] for x in vertex_format)
+    rows = np.asarray(vertices, dtype='float64').reshape(-1, stride)
+    columns = []
+    offset = 0
+    for name, size, kind in vertex_format:
+        values = rows[:, offset:offset + size]
+        offset += size
+        if name == 'v_pos_q':
+            x, high = _unpack(values[:, 0], 8)
+            low, z = _unpack(values[:, 1], POSITION_BITS)
+            steps = np.stack([x, high * 256 + low, z], axis=1)
+            columns.append(
+                np.asarray(ranges['pos_offset']) +
+                steps * np.asarray(ranges['pos_scale']))
+        elif name == 'v_normal_q':
+            columns.append(decode_octahedral(
+                np.stack(_unpack(values[:, 0], PACKED_BITS), axis=1)))
+        elif name == 'v_tc0_q':
+            steps = np.stack(_unpack(values[:, 0], PACKED_BITS), axis=1)
+            columns.append(
+                np.asarray(ranges['tc_offset']) +
+                steps * np.asarray(ranges['tc_scale']))
+        else:
+            columns.append(values)
+    unpacked = np.concatenate(
+        columns or [np.zeros((len(rows), 0))], axis=1).astype('float32')
+    return unpacked.reshape(-1), unpacked_format(vertex_format)
+
+
+def quantization_report(vertices, vertex_format, packed, packed_fmt,
+                        ranges):
+    """Return the bytes of the ``vertices`` of ``vertex_format`` and of
+    their ``packed`` version, and the largest error of each attribute
+    once unpacked: a distance for positions and texture coordinates, an
+    angle in degrees for normals."""
+    stride = sum(x[1] for x in vertex_format)
+    rows = np.asarray(vertices, dtype='float64').reshape(-1, stride)
+    unpacked = dequantize(packed, packed_fmt, ranges)[0].reshape(
+        -1, stride).astype('float64')
+    errors = {}
+    for name, size, kind in vertex_format:
+        if (name, size, kind) in packed_fmt or not len(rows):
+            continue
+        offset = attribute_offset(vertex_format, name)
+        original = rows[:, offset:offset + size]
+        decoded = unpacked[:, offset:offset + size]
+        if name == 'v_normal':
+            length = np.sqrt((original ** 2).sum(axis=1))
+            cosines = (original * decoded).sum(axis=1) / np.where(
+                length > 0, length, 1)
+            angles = np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+            errors[name] = float(angles[length > 0].max(initial=0))
+        else:
+            errors[name] = float(
+                np.sqrt(((original - decoded) ** 2).sum(axis=1)).max())
+    return {
+        'bytes': 4 * len(rows) * stride,
+        'packed_bytes': 4 * len(rows) * sum(x[1] for x in packed_fmt),
+        'errors': errors}
@@ -0,0 +1,144 @@
+'''Hierarchy of the transforms of the objects of a scene.
+
+Each node has a local matrix, relative to its parent, and a world matrix,
+relative to the scene. Changing a node marks its subtree dirty, and
+:meth:`SceneGraph.update` only recomputes the world matrices of dirty
+nodes, a level of the tree at a time with batched matrix products.
+
+Matrices are 4x4 numpy arrays like in :mod:`frustum`.
+'''
+import numpy as np
+
+import frustum
+
+
+def trs(translation=(0, 0, 0), rotation=(0, 0, 0), scale=1):
+    """Return the matrix translating by ``translation``, of a rotation by
+    ``rotation`` degrees around the x, y then z axes, and of ``scale``,
+    applied to the vertices in the reverse order."""
+    return (
+        frustum.translation(translation).dot(
+            frustum.rotation(rotation[0], 1, 0, 0)).dot(
+            frustum.rotation(rotation[1], 0, 1, 0)).dot(
+            frustum.rotation(rotation[2], 0, 0, 1)).dot(
+            frustum.scaling(scale)))
+
+
+class SceneGraph(object):
+    """Named nodes with a transform relative to their parent's."""
+    def __init__(self, names=()):
+        self.names = []
+        self._indices = {}
+        self._parents = np.zeros(0, dtype='int64')
+        self._local = np.zeros((0, 4, 4))
+        self._world = np.zeros((0, 4, 4))
+        self._dirty = np.zeros(0, dtype=bool)
+        # node numbers of each depth, from the roots
+        self._levels = None
+        self.add(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._indices
+
+    def add(self, names, parent=None):
+        """Add nodes ``names``, with identity transforms, under node
+        ``parent``, or as roots."""
+        names = [name for name in names if name not in self._indices]
+        if not names:
+            return
+        start = len(self.names)
+        for i, name in enumerate(names):
+            self._indices[name] = start + i
+        self.names.extend(names)
+
+        count = len(names)
+        parent = -1 if parent is None else self._indices[parent]
+        identity = np.tile(np.identity(4), (count, 1, 1))
+        self._parents = np.concatenate(
+            [self._parents, np.full(count, parent, dtype='int64')])
+        self._local = np.concatenate([self._local, identity])
+        self._world = np.concatenate([self._world, identity])
+        self._dirty = np.concatenate([self._dirty, np.ones(count, bool)])
+        self._levels = None
+
+    def parent(self, name):
+        """Return the name of the parent of node ``name``, or None."""
+        index = self._parents[self._indices[name]]
+        return None if index < 0 else self.names[index]
+
+    def set_parent(self, name, parent):
+        """Move node ``name`` under node ``parent``, or to the roots if
+        None, keeping its local transform."""
+        index = self._indices[name]
+        if parent is None:
+            self._parents[index] = -1
+        else:
+            ancestor = self._indices[parent]
+            while ancestor >= 0:
+                if ancestor == index:
+                    raise ValueError(
+                        '%s is an ancestor of %s' % (name, parent))
+                ancestor = self._parents[ancestor]
+            self._parents[index] = self._indices[parent]
+        self._dirty[index] = True
+        self._levels = None
+
+    def set_matrix(self, name, matrix):
+        """Set the local transform of node ``name``."""
+        index = self._indices[name]
+        self._local[index] = matrix
+        self._dirty[index] = True
+
+    def set_transform(self, name, translation=(0, 0, 0), rotation=(0, 0, 0),
+                      scale=1):
+        """Set the local transform of node ``name``, see :func:`trs`."""
+        self.set_matrix(name, trs(translation, rotation, scale))
+
+    def local(self, name):
+        return self._local[self._indices[name]]
+
+    def world(self, names):
+        """Return the (N, 4, 4) world matrices of nodes ``names``, as of
+        the last :meth:`update`."""
+        return self._world[[self._indices[name] for name in names]]
+
+    def levels(self):
+        if self._levels is None:
+            depths = np.zeros(len(self.names), dtype='int64')
+            has_parent = self._parents >= 0
+            while True:
+                deeper = np.where(
+                    has_parent, depths[self._parents] + 1, 0)
+                if (deeper == depths).all():
+                    break
+                depths = deeper
+            order = np.argsort(depths, kind='stable')
+            bounds = np.searchsorted(
+                depths[order], np.arange(depths.max(initial=0) + 2))
+            self._levels = [
+                order[start:end] for start, end in zip(bounds, bounds[1:])]
+        return self._levels
+
+    def update(self):
+        """Recompute the world matrices of the dirty nodes and their
+        descendants, return the names of those nodes."""
+        dirty = self._dirty
+        if not dirty.any():
+            return []
+        for depth, nodes in enumerate(self.levels()):
+            if depth:
+                dirty[nodes] |= dirty[self._parents[nodes]]
+            nodes = nodes[dirty[nodes]]
+            if not len(nodes):
+                continue
+            if depth:
+                self._world[nodes] = np.matmul(
+                    self._world[self._parents[nodes]], self._local[nodes])
+            else:
+                self._world[nodes] = self._local[nodes]
+        changed = np.flatnonzero(dirty)
+        dirty[:] = False
+        return [self.names[i] for i in changed]
@@ -12,17 +12,38 @@ simple diffuse lighting based on laberts cosine law; see e.g.:
 attribute vec3 v_pos;
 attribute vec3 v_normal;
 attribute vec2 v_tc0;
+// material attributes of the former vertex format
 attribute vec3 v_ambient;
 attribute vec3 v_diffuse;
 attribute vec3 v_specular;
 attribute float v_specular_coeff;
 attribute float v_transparency;
+// packed attributes of the compact vertex formats, see quantization.py
+attribute vec2 v_pos_q;
+attribute float v_normal_q;
+attribute float v_tc0_q;
 
 varying vec2 uv_vec;
 
 uniform mat4 modelview_mat;
 uniform mat4 projection_mat;
 
+// material of the mesh being drawn, unless per_vertex_material is 1
+uniform vec3 mat_ambient;
+uniform vec3 mat_diffuse;
+uniform vec3 mat_specular;
+uniform float mat_specular_coeff;
+uniform float mat_transparency;
+uniform float per_vertex_material;
+
+// whether the position, normal and texture coordinates are packed, and
+// the ranges they are quantized across
+uniform vec3 quantized;
+uniform vec3 pos_offset;
+uniform vec3 pos_scale;
+uniform vec2 tc_offset;
+uniform vec2 tc_scale;
+
 varying vec4 normal_vec;
 varying vec4 vertex_pos;
 
@@ -32,18 +53,45 @@ varying vec3 v_s;
 varying float v_sc;
 varying float v_alpha;
 
+// high and low parts of the integers packed in a float
+vec2 unpack(float value, float base) {
+    float high = floor(value / base);
+    return vec2(high, value - high * base);
+}
+
+vec3 decode_position(vec2 value) {
+    // x and the 8 high bits of y, the 8 low ones and z
+    vec2 xy = unpack(value.x, 256.0);
+    vec2 yz = unpack(value.y, 65536.0);
+    return pos_offset + pos_scale * vec3(xy.x, xy.y * 256.0 + yz.x, yz.y);
+}
+
+vec3 decode_normal(float value) {
+    // octahedral encoding, the lower half folded on the corners
+    vec2 e = unpack(value, 4096.0) / 4095.0 * 2.0 - 1.0;
+    vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+    if (n.z < 0.0)
+        n.xy = (1.0 - abs(n.yx)) * (step(0.0, n.xy) * 2.0 - 1.0);
+    return normalize(n);
+}
+
 void main (void) {
+    vec3 position = mix(v_pos, decode_position(v_pos_q), quantized.x);
+    vec3 normal = mix(v_normal, decode_normal(v_normal_q), quantized.y);
+    vec2 tc = mix(
+        v_tc0, tc_offset + tc_scale * unpack(v_tc0_q, 4096.0), quantized.z);
+
     //compute vertex position in eye_sapce and normalize normal vector
-    vec4 pos = modelview_mat * vec4(v_pos, 1.0);
+    vec4 pos = modelview_mat * vec4(position, 1.0);
     vertex_pos = pos;
-    normal_vec = vec4(v_normal,0.0);
+    normal_vec = vec4(normal,0.0);
     gl_Position = projection_mat * pos;
-    uv_vec = v_tc0;
-    v_a = v_ambient;
-    v_d = v_diffuse;
-    v_s = v_specular;
-    v_sc = v_specular_coeff;
-    v_alpha = v_transparency;
+    uv_vec = tc;
+    v_a = mix(mat_ambient, v_ambient, per_vertex_material);
+    v_d = mix(mat_diffuse, v_diffuse, per_vertex_material);
+    v_s = mix(mat_specular, v_specular, per_vertex_material);
+    v_sc = mix(mat_specular_coeff, v_specular_coeff, per_vertex_material);
+    v_alpha = mix(mat_transparency, v_transparency, per_vertex_material);
 }
 
 
@@ -61,9 +109,14 @@ varying float v_sc;
 varying float v_alpha;
 
 uniform mat4 normal_mat;
+// lights reaching the mesh, in the coordinates of the scene, see lights.py
 uniform vec4 light_sources[16];
+// range of each light in x, 0 for lights reaching everything
+uniform vec4 light_ranges[16];
 uniform int nb_lights;
-uniform mat4 modelview_mat;
+// transforms of the scene without those of the objects, and its scale
+uniform mat4 view_mat;
+uniform float view_scale;
 varying vec2 uv_vec;
 
 uniform float ambiant;
@@ -72,14 +125,23 @@ uniform float specular;
 
 uniform sampler2D tex;
 
-vec3 get_light(vec4 light, vec4 v_normal){
+// color of the instance being drawn, multiplying the lit one
+uniform vec4 instance_tint;
+
+vec3 get_light(vec4 light, float range, vec4 v_normal){
     vec4 v_light = normalize(light - vertex_pos);
     vec3 theta = v_d * clamp(dot(v_normal, v_light), 0.0, 1.0) * diffuse;
 
     // specular
     vec3 sp = specular * v_s * pow(max(dot(normal_vec, normalize(vertex_pos - v_light)), 0.0), v_sc);
 
-    return v_a + (theta + sp) / log(distance(vertex_pos, v_light));
+    // fading out up to the range of the light
+    float reach = 1.0;
+    if (range > 0.0)
+        reach = clamp(
+            1.0 - distance(vertex_pos, light) / (range * view_scale),
+            0.0, 1.0);
+    return reach * (v_a + (theta + sp) / log(distance(vertex_pos, v_light)));
 }
 
 void main (void){
@@ -88,10 +150,14 @@ void main (void){
 
     //reflectance based on lamberts law of cosine
     vec3 light = vec3(0.0, 0.0, 0.0);
-    for (int i = 0; i < nb_lights; i++){
-        light += get_light(modelview_mat * light_sources[i], v_normal);
+    // constant bounds, as GLSL ES requires
+    for (int i = 0; i < 16; i++){
+        if (i >= nb_lights)
+            break;
+        light += get_light(
+            view_mat * light_sources[i], light_ranges[i].x, v_normal);
     }
 
     vec4 color = texture2D(tex, vec2(uv_vec.x, 1.0 - uv_vec.y)) * vec4(light, v_alpha);
-    gl_FragColor = color;
+    gl_FragColor = color * instance_tint;
 }
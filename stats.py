@@ -0,0 +1,85 @@
+'''Instrumentation of the loading and drawing of scenes.
+
+A :class:`Stats` accumulates the time spent in named stages, and counters.
+Loaders record their parse, material and buffers stages in one, the
+renderer adds the texture decoding, the uploads and what it draws.
+'''
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+
+class Stats(object):
+    """Seconds spent in each stage, in :attr:`timings`, and
+    :attr:`counters`, by name.
+
+    Stages can be nested, the time of a stage doesn't include the one of
+    the stages it contains. ``profiler``, if given, is called with the name
+    of each stage entered and returns a context manager wrapping it, to
+    plug a sampling profiler; it's called in loading threads too.
+    """
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self._lock = threading.Lock()
+        # durations of the nested stages running in each thread
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager adding the time spent in it to stage ``name``."""
+        nested = getattr(self._local, 'nested', None)
+        if nested is None:
+            nested = self._local.nested = []
+        nested.append(0)
+        start = timer()
+        try:
+            if self.profiler is None:
+                yield
+            else:
+                with self.profiler(name):
+                    yield
+        finally:
+            duration = timer() - start
+            inner = nested.pop()
+            if nested:
+                nested[-1] += duration
+            self.add_time(name, duration - inner)
+
+    def add_time(self, name, duration):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0) + duration
+
+    def count(self, name, value=1):
+        """Add ``value`` to counter ``name``."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def update(self, other):
+        """Add the timings and counters of Stats ``other`` to these."""
+        for name, duration in list(other.timings.items()):
+            self.add_time(name, duration)
+        for name, value in list(other.counters.items()):
+            self.count(name, value)
+
+    def clear(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def as_dict(self):
+        return {
+            'timings': dict(self.timings),
+            'counters': dict(self.counters)}
+
+    def __str__(self):
+        return ', '.join(
+            ['%s %.3fs' % item for item in self.timings.items()] +
+            ['%s %s' % item for item in self.counters.items()])
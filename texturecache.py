@@ -0,0 +1,189 @@
+'''Process wide cache of the textures of meshes.
+
+Textures are keyed on their resolved path and wrap mode, so a file shared
+by many meshes, renderers or successive canvas rebuilds is decoded once.
+Users take a reference with :meth:`TextureCache.acquire` and give it back
+with :meth:`TextureCache.release`, textures nobody references are kept,
+least recently used first, until they go over the memory budget.
+'''
+import logging
+from collections import OrderedDict
+from functools import partial
+from os.path import abspath
+from threading import Thread
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage, ImageLoader
+
+from stats import Stats
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry(object):
+    def __init__(self, texture):
+        self.texture = texture
+        self.refcount = 0
+        self.size = texture.width * texture.height * len(texture.colorfmt)
+
+
+class TextureCache(object):
+    """Cache of the textures loaded from files, bounded to ``max_size``
+    bytes of unused textures.
+
+    With :meth:`acquire_async`, files are decoded by ``workers`` background
+    threads, only the upload to the gpu happens in the main thread.
+
+    The time spent decoding files and uploading textures is added to the
+    'texture_decode' and 'upload' stages of the ``stats`` given to the
+    acquire methods, or of the cache's own :attr:`stats`.
+    """
+    def __init__(self, max_size=256 * 1024 * 1024, workers=2):
+        self.max_size = max_size
+        self.workers = workers
+        self._entries = OrderedDict()
+        # callbacks waiting for each key being decoded
+        self._pending = {}
+        self._queue = None
+        self.stats = Stats()
+
+    def key(self, source, wrap='repeat'):
+        return abspath(source), wrap
+
+    @property
+    def size(self):
+        """Bytes used by the cached textures."""
+        return sum(entry.size for entry in self._entries.values())
+
+    def texture_size(self, source, wrap='repeat'):
+        """Bytes used by the texture of ``source`` with ``wrap``, 0 if it
+        isn't cached."""
+        entry = self._entries.get(self.key(source, wrap))
+        return entry.size if entry is not None else 0
+
+    def acquire(self, source, wrap='repeat', stats=None):
+        """Return the texture of file ``source`` with ``wrap``, loading it
+        if needed, and take a reference on it. Return None if the file
+        can't be loaded."""
+        key = self.key(source, wrap)
+        stats = stats if stats is not None else self.stats
+        if key not in self._entries:
+            with stats.stage('texture_decode'):
+                try:
+                    loader = ImageLoader.load(key[0], nocache=True)
+                    error = None
+                except Exception as e:
+                    loader, error = None, e
+            if loader is None:
+                logger.error(
+                    "TextureCache: error loading texture %s, %s", source,
+                    error)
+                return None
+            self._add(key, loader, stats)
+            texture = self._take(key)
+            # once referenced, so the new texture stays
+            self.evict()
+            return texture
+        return self._take(key)
+
+    def acquire_async(self, source, callback, wrap='repeat', stats=None):
+        """Call ``callback`` with the texture of file ``source`` with
+        ``wrap``, or None if it can't be loaded, once it's decoded in the
+        background, a reference is taken for the callback.
+
+        The callback is called right away if the texture is cached.
+        """
+        key = self.key(source, wrap)
+        if key in self._entries:
+            callback(self._take(key))
+            return
+
+        if key in self._pending:
+            self._pending[key].append(callback)
+            return
+        self._pending[key] = [callback]
+
+        if self._queue is None:
+            self._queue = Queue()
+            for i in range(self.workers):
+                thread = Thread(target=self._decode_thread)
+                thread.daemon = True
+                thread.start()
+        self._queue.put((key, stats if stats is not None else self.stats))
+
+    def _decode_thread(self):
+        while True:
+            key, stats = self._queue.get()
+            with stats.stage('texture_decode'):
+                try:
+                    loader = ImageLoader.load(key[0], nocache=True)
+                    error = None
+                except Exception as e:
+                    loader, error = None, e
+            # textures can only be created in the main thread
+            Clock.schedule_once(
+                partial(self._decoded, key, loader, error, stats))
+
+    def _decoded(self, key, loader, error, stats, *args):
+        callbacks = self._pending.pop(key, [])
+        if key not in self._entries:
+            if error is not None or loader is None:
+                logger.error(
+                    "TextureCache: error loading texture %s, %s", key[0],
+                    error)
+                for callback in callbacks:
+                    callback(None)
+                return
+            self._add(key, loader, stats)
+
+        for callback in callbacks:
+            callback(self._take(key))
+        self.evict()
+
+    def _add(self, key, loader, stats):
+        with stats.stage('upload'):
+            texture = CoreImage(loader).texture
+            texture.wrap = key[1]
+        self._entries[key] = _Entry(texture)
+
+    def _take(self, key):
+        entry = self._entries[key]
+        entry.refcount += 1
+        # most recently used last
+        self._entries.pop(key)
+        self._entries[key] = entry
+        return entry.texture
+
+    def release(self, source, wrap='repeat'):
+        """Give back a reference taken on the texture of ``source`` with
+        ``wrap``."""
+        entry = self._entries.get(self.key(source, wrap))
+        if entry is not None and entry.refcount:
+            entry.refcount -= 1
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used unreferenced textures until the
+        cache fits in :attr:`max_size`."""
+        total = self.size
+        for key, entry in list(self._entries.items()):
+            if total <= self.max_size:
+                break
+            if not entry.refcount:
+                del self._entries[key]
+                total -= entry.size
+
+    def clear(self):
+        """Remove all the unreferenced textures."""
+        for key, entry in list(self._entries.items()):
+            if not entry.refcount:
+                del self._entries[key]
+
+
+# cache shared by all the renderers of the process
+texture_cache = TextureCache()
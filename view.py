@@ -18,7 +18,10 @@ class MultitouchCamera(object):
         self.touches = []
         self.touches_center = []
         self.touches_dist = 0
-        Clock.schedule_interval(self.update_cam, 0)
+        # position of each touch at the last camera update
+        self.touches_pos = {}
+        # the camera is updated once per frame at most, when touches moved
+        self._trigger_cam = Clock.create_trigger(self.update_cam)
 
     def on_touch_down(self, touch):
         if super(MultitouchCamera, self).on_touch_move(touch):
@@ -26,18 +29,32 @@ class MultitouchCamera(object):
 
         if self.collide_point(*touch.pos):
             self.touches.append(touch)
+            self.touches_pos[touch.uid] = tuple(touch.pos)
             touch.grab(self)
             if len(self.touches) > 1:
                 self.touches_center = self.get_center()
                 self.touches_dist = self.get_dist(self.touches_center)
 
+    def on_touch_move(self, touch):
+        if touch.grab_current is self:
+            self._trigger_cam()
+            return True
+        return super(MultitouchCamera, self).on_touch_move(touch)
+
+    def get_delta(self, touch):
+        """Return how much ``touch`` moved since the last camera update."""
+        x, y = self.touches_pos.get(touch.uid, touch.pos)
+        self.touches_pos[touch.uid] = tuple(touch.pos)
+        return touch.x - x, touch.y - y
+
     def update_cam(self, dt):
         if not self.touches:
             return
 
         elif len(self.touches) == 1:
-            self.cam_translation[0] += self.touches[0].dx / 100.
-            self.cam_translation[1] += self.touches[0].dy / 100.
+            dx, dy = self.get_delta(self.touches[0])
+            self.cam_translation[0] += dx / 100.
+            self.cam_translation[1] += dy / 100.
 
         else:
             c = self.get_center()
@@ -49,12 +66,15 @@ class MultitouchCamera(object):
 
             self.touches_center = c
             self.touches_dist = d
+        for touch in self.touches:
+            self.touches_pos[touch.uid] = tuple(touch.pos)
         return True
 
     def on_touch_up(self, touch):
         if touch.grab_current is self:
             touch.ungrab(self)
             self.touches.remove(touch)
+            self.touches_pos.pop(touch.uid, None)
             self.touches_center = self.get_center()
             self.touches_dist = self.get_dist(self.touches_center)
         else:
@@ -85,8 +105,9 @@ class MultitouchCenteredCamera(MultitouchCamera):
             return
 
         elif len(self.touches) == 1:
-            self.cam_rotation[1] += self.touches[0].dx / 5.
-            self.cam_rotation[0] -= self.touches[0].dy / 5.
+            dx, dy = self.get_delta(self.touches[0])
+            self.cam_rotation[1] += dx / 5.
+            self.cam_rotation[0] -= dy / 5.
 
         else:
             c = self.get_center()
@@ -95,14 +116,33 @@ class MultitouchCenteredCamera(MultitouchCamera):
             self.obj_scale += (d - self.touches_dist) / 100.
             self.touches_center = c
             self.touches_dist = d
+        for touch in self.touches:
+            self.touches_pos[touch.uid] = tuple(touch.pos)
         return True
 
 
 class BaseView(ObjectRenderer):
     time = NumericProperty(0)
     light_radius = NumericProperty(20)
+    nb_lights = NumericProperty(4)
     move_light = BooleanProperty(True)
 
+    def __init__(self, **kwargs):
+        super(BaseView, self).__init__(**kwargs)
+        self.on_move_light()
+
+    def on_move_light(self, *args):
+        # lights are only animated, every frame, while move_light is set
+        Clock.unschedule(self.update_lights)
+        if self.move_light:
+            Clock.schedule_interval(self.update_lights, 0)
+
+    def on_nb_lights(self, *args):
+        self.update_lights(0)
+
+    def on_light_radius(self, *args):
+        self.update_lights(0)
+
     def reset(self, *args):
         Animation(
             cam_rotation=(20, 0, 0),
@@ -111,18 +151,16 @@ class BaseView(ObjectRenderer):
             d=2).start(self)
 
     def update_lights(self, dt):
-        if not self.move_light:
-            return
         self.time += dt
         self.time %= 2 * pi
-        for i in range(self.nb_lights):
-            a = self.time + i * 2 * pi / self.nb_lights
-            self.light_sources[i] = [
+        nb_lights = int(self.nb_lights)
+        # replaced at once, so the uniforms are only updated once
+        light_sources = {}
+        for i in range(nb_lights):
+            a = self.time + i * 2 * pi / nb_lights
+            light_sources[i] = [
                 cos(a) * self.light_radius, 5, sin(a) * self.light_radius, 1.0]
-
-        for k in self.light_sources.keys():
-            if k >= self.nb_lights:
-                del(self.light_sources[k])
+        self.light_sources = light_sources
 
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos):
@@ -276,8 +314,6 @@ if __name__ == '__main__':
 
     class App3D(App):
         def build(self):
-            root = Builder.load_string(KV)
-            Clock.schedule_interval(root.ids.rendering.update_lights, 0)
-            return root
+            return Builder.load_string(KV)
 
     App3D().run()